@@ -0,0 +1,65 @@
+import PIL.Image
+import PIL.ImageDraw
+import sys
+import timeit
+from utils import integers, images
+from imagegeneration.shop import darkenRect
+
+def darken_rect_loop(image,start,end,amount=25):
+    """The per pixel darkenRect ItemImage used before, kept for comparison"""
+    draw = PIL.ImageDraw.Draw(image)
+    for x in range(start[0],end[0]):
+        for y in range(start[1],end[1]):
+            color = image.getpixel((x,y))
+            r = integers.min(color[0]-amount,0)
+            g = integers.min(color[1]-amount,0)
+            b = integers.min(color[2]-amount,0)
+            a = color[3]
+            color = (r,g,b,a)
+            draw.point((x,y),fill=color)
+
+def sample_image(size):
+    channels = [PIL.Image.effect_noise((size,size),100).convert('L') for i in range(4)]
+    return PIL.Image.merge('RGBA',channels)
+
+def darken_rect(size=512,amount=35,number=5):
+    """Times both darkenRect versions on an item sized image and checks they give the same pixels"""
+    image = sample_image(size)
+    start = (0,round(size*0.7))
+    end = (size,size)
+    old = image.copy()
+    new = image.copy()
+    darken_rect_loop(old,start,end,amount)
+    darkenRect(new,start,end,amount)
+    if old.tobytes() != new.tobytes():
+        raise AssertionError('darkenRect output differs from the per pixel version')
+    old_time = timeit.timeit(lambda: darken_rect_loop(image.copy(),start,end,amount),number=number)/number
+    new_time = timeit.timeit(lambda: darkenRect(image.copy(),start,end,amount),number=number)/number
+    print('darkenRect size {0}: loop {1:.2f}ms, point {2:.2f}ms ({3:.0f}x)'.format(size,old_time*1000,new_time*1000,old_time/new_time))
+
+def radial_gradient(sizes=((512,512),(64,64),(100,60),(60,100)),number=3):
+    """Times the per pixel gradient against radial_gradient_image and reports the largest channel difference"""
+    gradient = ((96,170,58,255),(23,81,23,255))
+    for size in sizes:
+        def loop():
+            image = PIL.Image.new('RGBA',size)
+            images.radial_gradient(PIL.ImageDraw.Draw(image),size[0],size[1],gradient[0],gradient[1])
+            return image
+        old = loop()
+        new = images.radial_gradient_image(size,gradient[0],gradient[1])
+        difference = max(abs(a-b) for a, b in zip(old.tobytes(),new.tobytes()))
+        if difference > 1:
+            raise AssertionError('radial_gradient_image differs from the per pixel version by {0} at {1}'.format(difference,size))
+        old_time = timeit.timeit(loop,number=number)/number
+        new_time = timeit.timeit(lambda: images.radial_gradient_image(size,gradient[0],gradient[1]),number=number)/number
+        print('radial gradient size {0}x{1}: loop {2:.2f}ms, imagemath {3:.2f}ms ({4:.0f}x), max difference {5}'.format(size[0],size[1],old_time*1000,new_time*1000,old_time/new_time,difference))
+
+BENCHMARKS = {
+    'darken_rect': darken_rect,
+    'radial_gradient': radial_gradient
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -1,5 +1,6 @@
 import discord
 import asyncio
+import functools
 import json
 import os
 import os.path
@@ -10,20 +11,21 @@ import time
 import traceback
 import logging
 import logging.config
-import transportDefs
+from io import BytesIO
 
 import localisation
-from modules import default, fortnite, moderation, testing
+from modules import default, fortnite, moderation, testing, dispatch
 from modules.module import Command
 from dataretrieval import meta, cheatsheets
-from imagegeneration import shop, upcoming
-from datamanagement import sql
-from utils import getEnv
+from imagegeneration import render
+from datamanagement import sql, aiosql, shared
+from utils import getEnv, http
 from utils.times import day_string as parse_second_time
 from utils.times import tommorow
 from time import time as now
-from utils.discord import count_client_users, get_server_priority
+from utils.discord import count_client_users, get_broadcast_targets
 from codemodules import modals
+from shards import HEARTBEAT_INTERVAL
 
 # constants
 KEY_DISCORD = getEnv("KEY_DISCORD")
@@ -35,6 +37,21 @@ TICKER_TIME = int(getEnv("TICKER_TIME", 30))
 DEFAULT_PREFIX = getEnv("DEFAULT_PREFIX",".rb ")
 VERSION = {'name': BOT_NAME, 'version_name': '1.1.6', 'revison': getEnv('HEROKU_RELEASE_VERSION', 'v1'), 'description': getEnv('HEROKU_SLUG_DESCRIPTION', '')}
 RATE_LIMIT_TIME = 0.25
+SETTINGS_CACHE_TTL = int(getEnv("SETTINGS_CACHE_TTL", 300))
+DATABASE_WORKERS = int(getEnv("DATABASE_WORKERS", 4))
+NEWS_SEEN_TTL = 60*60*24*30
+NEWS_PRUNE_INTERVAL = 60*60*24
+# how long fetched upstream data is shared between shards, a little under each loop's interval
+STATUS_SHARE_TTL = 110
+NEWS_SHARE_TTL = 290
+CHEAT_SHEETS_SHARE_TTL = 590
+# seconds before retrying a server whose shop image failed to render
+SHOP_RETRY_TIME = 60*15
+# the fetcher lease is renewed well within its ttl so it only changes hands when its shard stops
+FETCHER_LEASE_TTL = 60
+FETCHER_RENEW_TIME = 15
+# seconds between logging how many messages were filtered before reaching commandHandler
+MESSAGE_STATS_INTERVAL = 60*10
 
 # functions
 def checkPermissions(channel,type,settings):
@@ -113,87 +130,161 @@ def debugger(client,function):
             count += 1
 
 
+@asyncio.coroutine
+def broadcast_targets(client,channel_type):
+    targets = yield from get_broadcast_targets(list(client.servers),channel_type,client.database.get_channel_subscribers,client.database.get_priority_servers)
+    return targets
+
+
+def shop_due(server):
+    nextshop = server.get('next_shop')
+    if nextshop is None:
+        nextshop = time.mktime(datetime.now().utctimetuple())
+    return nextshop
+
 @asyncio.coroutine
 def autoshop(client): # add fnbr not accessable fallback
     logger = logging.getLogger('autoshop')
     yield from client.wait_until_ready()
     logger.info('Autoshop started')
     while not client.is_closed:
-        servers = yield from get_server_priority(list(client.servers),client.database.get_priority_servers)
-        needRestart = False
-        for servers_r in servers:
-            if needRestart:
-                break
-            for serverd in servers_r:
-                serverid = serverd.id
-                server = client.database.server_info(serverid,backgrounds=True,channels=True)
-                if 'autoshop' in server['channels']:
-                    locale = server.get('locale')
-                    now = time.time()
-                    nextshop = server.get('next_shop')
-                    if nextshop is None:
-                        nextshop = time.mktime(datetime.now().utctimetuple())
-                    if now >= nextshop:
+        targets = yield from broadcast_targets(client,'autoshop')
+        now = time.time()
+        due_times = []
+        due = [(serverid, server.get('backgrounds',{}).get('shop',[])) for serverid, server in targets if now >= shop_due(server)]
+        variants = {}
+        if len(due) > 0:
+            try:
+                variants = yield from render.shop_variants(KEY_FNBR,due)
+            except:
+                error = traceback.format_exc()
+                logger.error('Error generating images: %s',error)
+        for serverid, server in targets:
+            locale = server.get('locale')
+            now = time.time()
+            nextshop = shop_due(server)
+            if now < nextshop:
+                due_times.append(nextshop)
+            else:
+                try:
+                    variant = variants.get(serverid)
+                    if variant is None:
                         bgs = server.get('backgrounds',{})
                         bgs_s = bgs.get('shop',[])
+                        variant = yield from render.shop_image(KEY_FNBR,serverid,bgs_s)
+                    elif isinstance(variant,Exception):
+                        raise variant
+                    file, image = variant
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Error generating image for %s: %s',serverid,error)
+                    nextshop = now + SHOP_RETRY_TIME
+                    try:
+                        yield from client.database.set_server_info(serverid,next_shop=nextshop)
+                    except:
+                        error = traceback.format_exc()
+                        logger.error('Error updating database: {0}'.format(error))
+                    due_times.append(nextshop)
+                    continue
+                content = localisation.getMessage('autoshop',lang=locale)
+                nextshoptime = tommorow()
+                try:
+                    yield from client.send_file(discord.Object(server['channels']['autoshop']),BytesIO(image),filename=file,content=content)
+                    yield from client.database.set_server_info(serverid,next_shop=nextshoptime,latest_shop=file)
+                    due_times.append(nextshoptime)
+                except (discord.errors.Forbidden, discord.errors.NotFound):
+                    logger.info('Forbidden or not found on server: {}'.format(serverid))
+                    serverdata = client.get_server(serverid)
+                    if serverdata is None:
+                        yield from client.database.delete_server(serverid)
+                    else:
                         try:
-                            file = yield from shop.generate(KEY_FNBR,serverid,bgs_s)
+                            yield from client.database.set_server_info(serverid,next_shop=nextshoptime,latest_shop=file)
+                            yield from client.database.set_server_channel(serverid,'autoshop',None)
                         except:
                             error = traceback.format_exc()
-                            logger.error('Error generating image: %s',error)
-                            needRestart = True
-                            break
-                        content = localisation.getMessage('autoshop',lang=locale)
-                        nextshoptime = tommorow()
+                            logger.error('Error updating database: {0}'.format(error))
                         try:
-                            yield from client.send_file(discord.Object(server['channels']['autoshop']),file,content=content)
-                            client.database.set_server_info(serverid,next_shop=nextshoptime,latest_shop=file)
-                        except (discord.errors.Forbidden, discord.errors.NotFound):
-                            logger.info('Forbidden or not found on server: {}'.format(serverid))
-                            serverdata = client.get_server(serverid)
-                            if serverdata is None:
-                                client.database.delete_server(serverid)
-                            else:
-                                try:
-                                    client.database.set_server_info(serverid,next_shop=nextshoptime,latest_shop=file)
-                                    client.database.set_server_channel(serverid,'autoshop',None)
-                                except:
-                                    error = traceback.format_exc()
-                                    logger.error('Error updating database: {0}'.format(error))
-                                try:
-                                    text = localisation.getFormattedMessage('autoshop_no_access',channel=server['channels']['autoshop'],server_name=serverdata.name,lang=locale)
-                                    yield from client.send_message(serverdata.owner,content=text)
-                                except:
-                                    error = traceback.format_exc()
-                                    logger.error('Error sending message to owner: {0}'.format(error))
+                            text = localisation.getFormattedMessage('autoshop_no_access',channel=server['channels']['autoshop'],server_name=serverdata.name,lang=locale)
+                            yield from client.send_message(serverdata.owner,content=text)
                         except:
                             error = traceback.format_exc()
-                            logger.error('Error sending shop: %s', error)
-                        yield from asyncio.sleep(RATE_LIMIT_TIME)
-            time_until_next = nextshop-now
-            if time_until_next < 0:
-                time_until_next = 1
-            else:
-                time_until_next += 10
+                            logger.error('Error sending message to owner: {0}'.format(error))
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Error sending shop: %s', error)
+                    due_times.append(nextshop)
+                yield from asyncio.sleep(RATE_LIMIT_TIME)
+        # sleep until the earliest server is due, not just the last one looked at
+        nextshop = min(due_times) if len(due_times) > 0 else now + 60
+        time_until_next = nextshop-now
+        if time_until_next < 0:
+            time_until_next = 1
+        else:
+            time_until_next += 10
         logger.info("Autoshop now:%d next:%d updating in: %s", now, nextshop, parse_second_time(nextshop-now))
         yield from asyncio.sleep(time_until_next)
 
 
+@asyncio.coroutine
+def heartbeat(client):
+    """Beats from inside the shard's loop while its gateway is connected, so a stalled loop or lost connection misses beats"""
+    while not client.is_closed:
+        if client.is_logged_in and client.ws is not None and client.ws.open:
+            client.beat()
+        yield from asyncio.sleep(HEARTBEAT_INTERVAL)
+
+@asyncio.coroutine
+def elect(client):
+    """Keeps taking or renewing the fetcher lease, the shard holding it polls upstream and publishes events for every shard"""
+    logger = logging.getLogger('elect')
+    yield from client.wait_until_ready()
+    while not client.is_closed:
+        try:
+            leader = yield from shared.CACHE.acquire(shared.FETCHER_LEASE,FETCHER_LEASE_TTL,holder=client.holder)
+        except:
+            error = traceback.format_exc()
+            logger.error('Error renewing fetcher lease: %s',error)
+            leader = False
+        if leader != client.leader:
+            logger.info('Shard %d %s the fetcher',client.shard_id,'is now' if leader else 'is no longer')
+        client.leader = leader
+        client.elected.set()
+        yield from asyncio.sleep(FETCHER_RENEW_TIME)
+
+@asyncio.coroutine
+def new_events(client,topic):
+    """Events published to topic since this shard last looked, those from before it started are skipped"""
+    since = client.event_versions.get(topic,client.started)
+    events = yield from shared.CACHE.events(topic,since)
+    if len(events) > 0:
+        client.event_versions[topic] = events[-1][0]
+    return [data for version, data in events]
+
 @asyncio.coroutine
 def autostatus(client):
     logger = logging.getLogger('autostatus')
     yield from client.wait_until_ready()
+    yield from client.elected.wait()
     logger.info('Autostatus started')
     while not client.is_closed:
         update_time = now() + 120
         try:
-            data = yield from meta.getStatus()
-            logger.debug('Fetched status data (online: %s, services: %s)', data['online'], data['services'])
+            if client.leader:
+                data = yield from shared.CACHE.fetch_json('status',meta.getStatus,STATUS_SHARE_TTL)
+                yield from shared.CACHE.publish('status',data)
+                logger.debug('Fetched status data (online: %s, services: %s)', data['online'], data['services'])
+            events = yield from shared.CACHE.events('status')
         except:
             error = traceback.format_exc()
             logger.error('Error getting server status: %s',error)
             yield from asyncio.sleep(5)
             continue
+        if len(events) == 0:
+            logger.debug('No status published yet')
+            yield from asyncio.sleep(FETCHER_RENEW_TIME)
+            continue
+        data = events[-1][1]
         try:
             embed = fortnite.StatusEmbed(data['online'],data['message'])
             for s in data['services']:
@@ -202,153 +293,168 @@ def autostatus(client):
             error = traceback.format_exc()
             logger.error('Error compiling embed %s', error)
         logger.debug('Embed built')
-        servers = yield from get_server_priority(list(client.servers),client.database.get_priority_servers)
-        sent = []
-        for servers_r in servers:
-            for server_d in servers_r:
-                serverid = server_d.id
-                if serverid in sent:
-                    continue
-                else:
-                    sent.append(serverid)
+        targets = yield from broadcast_targets(client,'autostatus')
+        for serverid, server in targets:
+            last_status_msg = server.get('last_status_msg', None)
+            last_status_channel = server.get('last_status_channel', None)
+            channel = discord.Object(server['channels']['autostatus'])
+            channel.server = discord.Object(serverid)
+            old_message = None
+            if last_status_msg is not None and last_status_channel is not None:
                 try:
-                    server = client.database.server_info(serverid,channels=True)
+                    old_message = yield from client.get_message(channel, last_status_msg)
+                except (discord.errors.NotFound, discord.errors.Forbidden):
+                    old_message = None
                 except:
-                    server = None
-
-                if server is not None and 'autostatus' in server['channels']:
-                    last_status_msg = server.get('last_status_msg', None)
-                    last_status_channel = server.get('last_status_channel', None)
-                    channel = discord.Object(server['channels']['autostatus'])
-                    channel.server = discord.Object(serverid)
                     old_message = None
-                    if last_status_msg is not None and last_status_channel is not None:
-                        try:
-                            old_message = yield from client.get_message(channel, last_status_msg)
-                        except (discord.errors.NotFound, discord.errors.Forbidden):
-                            old_message = None
-                        except:
-                            old_message = None
-                            logger.error('Error getting message')
-                    if old_message is not None:
-                        if old_message.channel.server.id != serverid:
-                            logger.warning('Message from wrong server')
-                        try:
-                            message = yield from client.edit_message(old_message, embed = embed)
-                        except:
-                            error = traceback.format_exc()
-                            logger.error('Error editing message %s', error)
-                            message = None
-                    else:
-                        try:
-                            message = yield from client.send_message(channel, embed = embed)
-                        except discord.errors.NotFound:
-                            client.database.set_server_channel(serverid, 'autocheatsheets', None)
-                        except:
-                            error = traceback.format_exc()
-                            logger.error('Error sending message %s', error)
-                            message = None
-                    if message is not None:
-                        try:
-                            client.database.set_server_info(serverid, last_status_msg=message.id, last_status_channel=message.channel.id)
-                        except:
-                            error = traceback.format_exc()
-                            logger.error('Error updating server info %s', error)
-                    yield from asyncio.sleep(RATE_LIMIT_TIME)
+                    logger.error('Error getting message')
+            if old_message is not None:
+                if old_message.channel.server.id != serverid:
+                    logger.warning('Message from wrong server')
+                try:
+                    message = yield from client.edit_message(old_message, embed = embed)
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Error editing message %s', error)
+                    message = None
+            else:
+                try:
+                    message = yield from client.send_message(channel, embed = embed)
+                except discord.errors.NotFound:
+                    yield from client.database.set_server_channel(serverid, 'autocheatsheets', None)
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Error sending message %s', error)
+                    message = None
+            if message is not None:
+                try:
+                    yield from client.database.set_server_info(serverid, last_status_msg=message.id, last_status_channel=message.channel.id)
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Error updating server info %s', error)
+            yield from asyncio.sleep(RATE_LIMIT_TIME)
         next_time = update_time - now()
         logger.info('Autostatus update complete checking again in %s', parse_second_time(next_time))
         if next_time > 0:
             yield from asyncio.sleep(next_time)
 
 
+@asyncio.coroutine
+def fetch_news(language):
+    """meta.fetchNews, raising on a failed or malformed payload so it's never shared with the other shards"""
+    data = yield from meta.fetchNews(language)
+    if not data.get('success') or 'messages' not in data or 'updated' not in data:
+        raise RuntimeError('Unable to fetch news for {0}'.format(language))
+    return data
+
 @asyncio.coroutine
 def autonews(client):
     logger = logging.getLogger('autonews')
     yield from client.wait_until_ready()
+    yield from client.elected.wait()
     logger.info('Autonews started')
+    last_prune = 0
     while not client.is_closed:
         update_time = 300
-        cache = client.database.get_cache("news",once=False)
-        if cache is None:
-            cache = []
-        data = meta.getNews('en')
-        used = []
+        if client.leader:
+            try:
+                data = yield from shared.CACHE.fetch_json('news:en',functools.partial(fetch_news,'en'),NEWS_SHARE_TTL)
+                titles = [msg['title'] for msg in data['messages']]
+                unseen = yield from client.database.filter_unseen('news',titles)
+                messages = [msg for msg in data['messages'] if msg['title'] in unseen]
+                yield from client.database.mark_seen('news',titles,round(now()))
+                if len(messages) > 0:
+                    yield from shared.CACHE.publish('news',{'messages':messages,'updated':data['updated']})
+                    logger.info('Published %d news messages',len(messages))
+            except:
+                error = traceback.format_exc()
+                logger.error('Error getting news: %s',error)
+                yield from asyncio.sleep(5)
+                continue
+            if now() - last_prune > NEWS_PRUNE_INTERVAL:
+                yield from client.database.prune_seen('news',round(now())-NEWS_SEEN_TTL)
+                yield from shared.CACHE.prune()
+                last_prune = now()
         embeds = []
-        for msg in data['messages']:
-            if not msg['title'] in cache:
-                embeds.append(fortnite.NewsEmbed(msg,data['updated']))
-                client.database.set_cache("news",msg['title'],once=False)
-        servers = yield from get_server_priority(list(client.servers),client.database.get_priority_servers)
-        for servers_r in servers:
-            for serverd in servers_r:
-                serverid = serverd.id
-                server = client.database.server_info(serverid,channels=True)
-                if 'autonews' in server['channels']:
-                    for embed in embeds:
-                        try:
-                            yield from client.send_message(discord.Object(server['channels']['autonews']),embed=embed)
-                        except:
-                            error = traceback.format_exc()
-                            logger.error('Unable to send news update: %s',error)
-                    update_time -= RATE_LIMIT_TIME
-                    yield from asyncio.sleep(RATE_LIMIT_TIME)
+        events = yield from new_events(client,'news')
+        for event in events:
+            for msg in event['messages']:
+                embeds.append(fortnite.NewsEmbed(msg,event['updated']))
+        if len(embeds) > 0:
+            targets = yield from broadcast_targets(client,'autonews')
+            for serverid, server in targets:
+                for embed in embeds:
+                    try:
+                        yield from client.send_message(discord.Object(server['channels']['autonews']),embed=embed)
+                    except:
+                        error = traceback.format_exc()
+                        logger.error('Unable to send news update: %s',error)
+                update_time -= RATE_LIMIT_TIME
+                yield from asyncio.sleep(RATE_LIMIT_TIME)
         logger.info('Auto news update complete checking again in %s', parse_second_time(update_time))
         if update_time > 0:
             yield from asyncio.sleep(update_time)
 
 
+@asyncio.coroutine
+def publish_cheat_sheet(client,logger):
+    """Publishes the newest cheat sheet if it's newer than the last one published, only run by the fetcher"""
+    cache = yield from client.database.get_cache('last_cheat_sheet',once=True)
+    if cache is None:
+        cache = {'season':0,'week':0}
+    else:
+        try:
+            cache = json.loads(cache.get('last_cheat_sheet'))
+        except:
+            logger.debug(str(cache))
+            cache = {'season':0,'week':0}
+    old_cache = dict(cache)
+    update = None
+    posts = yield from shared.CACHE.fetch_json('reddit:'+cheatsheets.CHEAT_SHEET_USER,functools.partial(cheatsheets.get_reddit_posts,cheatsheets.CHEAT_SHEET_USER),CHEAT_SHEETS_SHARE_TTL)
+    data = yield from cheatsheets.parse_cheat_sheets(posts)
+    for sheet in data:
+        if ((sheet.season >= cache.get('season',0) and sheet.week > cache.get('week',0)) or sheet.season > cache.get('season',0)) and sheet.has_image:
+            cache['season'] = sheet.season
+            cache['week'] = sheet.week
+            update = sheet
+    if old_cache.get('season') != cache.get('season') or old_cache.get('week') != cache.get('week'):
+        yield from shared.CACHE.publish('cheatsheets',{'title':update.title,'season':update.season,'week':update.week,'image':update.image})
+        try:
+            yield from client.database.set_cache('last_cheat_sheet',json.dumps(cache),once=True)
+            logger.info('Updated cache')
+        except:
+            error = traceback.format_exc()
+            logger.error('Error updating cache: %s',error)
+    else:
+        logger.debug('%s\n%s',str(old_cache),str(cache))
+
 @asyncio.coroutine
 def autocheatsheets(client):
     logger = logging.getLogger('autosheets')
     yield from client.wait_until_ready()
+    yield from client.elected.wait()
     logger.info('Autosheets started')
     while not client.is_closed:
         update_time = 600
-        cache = client.database.get_cache('last_cheat_sheet',once=True)
-        if cache is None:
-            cache = {'season':0,'week':0}
-        else:
-            try:
-                cache = json.loads(cache.get('last_cheat_sheet'))
-            except:
-                logger.debug(str(cache))
-                cache = {'season':0,'week':0}
-        old_cache = dict(cache)
-        update = None
-        data = yield from cheatsheets.get_cheat_sheets()
-        for sheet in data:
-            if ((sheet.season >= cache.get('season',0) and sheet.week > cache.get('week',0)) or sheet.season > cache.get('season',0)) and sheet.has_image:
-                cache['season'] = sheet.season
-                cache['week'] = sheet.week
-                update = sheet
-        if old_cache.get('season') != cache.get('season') or old_cache.get('week') != cache.get('week'):
-            try:
-                client.database.set_cache('last_cheat_sheet',json.dumps(cache),once=True)
-                logger.info('Updated cache')
-            except:
-                error = traceback.format_exc()
-                logger.error('Error updating cache: %s',error)
-        else:
-            logger.debug('%s\n%s',str(old_cache),str(cache))
-        if update is not None:
+        if client.leader:
+            yield from publish_cheat_sheet(client,logger)
+        events = yield from new_events(client,'cheatsheets')
+        for update in events:
+            update = cheatsheets.CheatSheet(**update)
             title = localisation.getFormattedMessage('autocheatsheets_title',season=update.season,week=update.week)
             description = localisation.getMessage('autocheatsheets_desc')
             embed = discord.Embed(title=title,description=description,color=0xe67e22)
             embed.set_image(url=update.image)
             logger.info('Embed built {0}.{1} image url: {2}'.format(update.season,update.week,update.image))
-            servers = yield from get_server_priority(list(client.servers),client.database.get_priority_servers)
-            for servers_r in servers:
-                for serverd in servers_r:
-                    serverid = serverd.id
-                    server = client.database.server_info(serverid,channels=True)
-                    if 'autocheatsheets' in server.get('channels',[]):
-                        try:
-                            yield from client.send_message(discord.Object(server['channels']['autocheatsheets']),embed=embed)
-                        except:
-                            error = traceback.format_exc()
-                            logger.error('Unabled to send cheat sheet: %s',error)
-                        update_time -= RATE_LIMIT_TIME
-                        yield from asyncio.sleep(RATE_LIMIT_TIME)
+            targets = yield from broadcast_targets(client,'autocheatsheets')
+            for serverid, server in targets:
+                try:
+                    yield from client.send_message(discord.Object(server['channels']['autocheatsheets']),embed=embed)
+                except:
+                    error = traceback.format_exc()
+                    logger.error('Unabled to send cheat sheet: %s',error)
+                update_time -= RATE_LIMIT_TIME
+                yield from asyncio.sleep(RATE_LIMIT_TIME)
         logger.info('Auto cheat sheets update complete checking again in %s', parse_second_time(update_time))
         if update_time > 0:
             yield from asyncio.sleep(update_time)
@@ -418,24 +524,25 @@ def server_deleter(client):
     logger.info('Started')
     while not client.is_closed:
         last_seen = round(now())
-        for server in client.servers:
-            client.database.set_server_info(server.id,last_seen=last_seen)
-        purge_ready = client.database.get_purge(last_seen-delete_time)
-        for server in purge_ready:
-            client.database.delete_server(server.get('server_id'))
+        server_ids = [server.id for server in client.servers]
+        yield from client.database.touch_servers(server_ids,last_seen)
+        purge_ready = yield from client.database.get_purge(last_seen-delete_time)
+        yield from client.database.delete_servers([server.get('server_id') for server in purge_ready])
+        logger.info('Touched %d servers, purged %d', len(server_ids), len(purge_ready))
+        logger.info('Settings cache %s', client.database.cache_stats())
         yield from asyncio.sleep(60*60)
 
 @asyncio.coroutine
 def pre_cache():
     logger = logging.getLogger('pre-cache')
     try:
-        yield from shop.generate(KEY_FNBR,'',[])
+        yield from render.shop_image(KEY_FNBR,'',[])
         logger.info('Finished shop')
     except:
         error = traceback.format_exc()
         logger.error('Error precaching: %s',error)
     try:
-        yield from upcoming.generate(KEY_FNBR,'',[])
+        yield from render.upcoming_image(KEY_FNBR,'',[])
         logger.info('Finished upcoming')
     except:
         error = traceback.format_exc()
@@ -456,36 +563,36 @@ def commandHandler(client, command, msg, serversettings):
         command = command.lower()
     serverid = msg.server.id
     if serversettings.get("server_name") != msg.server.name:
-        client.database.set_server_info(serverid,server_name=msg.server.name)
+        yield from client.database.set_server_info(serverid,server_name=msg.server.name)
     output = Command()
     output.delete_command = False
+    dispatcher = client.dispatcher
+    aliases = dispatcher.aliases(msg.content,serversettings)
     if command != None:
-        output = yield from client.defaultmodule._run(client,output,command,msg,serversettings)
+        commands = dispatcher.commands(command)
+        output = yield from dispatcher.run(client,output,[client.defaultmodule],commands,msg,serversettings)
         if output.empty:
-            for i in range(0,len(client.cmodules)):
-                output = yield from client.cmodules[i]._run(client,output,command,msg,serversettings)
+            output = yield from dispatcher.run(client,output,client.cmodules,commands,msg,serversettings)
         if output.empty:
-            for i in range(0,len(client.cmodules)):
-                output = yield from client.cmodules[i]._run_alias(client,output,command,msg,serversettings)
+            output = yield from dispatcher.run(client,output,client.cmodules,aliases,msg,serversettings)
     else:
-        output = yield from client.defaultmodule._run_alias(client,output,command,msg,serversettings)
+        output = yield from dispatcher.run(client,output,[client.defaultmodule],aliases,msg,serversettings)
         if output.empty:
-            for i in range(0,len(client.cmodules)):
-                output = yield from client.cmodules[i]._run_alias(client,output,command,msg,serversettings)
+            output = yield from dispatcher.run(client,output,client.cmodules,aliases,msg,serversettings)
     if len(output.queue) > 0:
         client.queued_actions += output.queue
         logger.debug('Added queued action')
     if output.settings is not None:
         if 'channels' in output.settings:
             for type in output.settings['channels']:
-                client.database.set_server_channel(serverid,type,output.settings['channels'][type])
+                yield from client.database.set_server_channel(serverid,type,output.settings['channels'][type])
             output.settings.pop('channels')
         if 'backgrounds' in output.settings:
             backgrounds = output.settings.get('backgrounds')
             for type in backgrounds:
-                client.database.set_server_backgrounds(serverid,backgrounds=backgrounds.get(type),type=type)
+                yield from client.database.set_server_backgrounds(serverid,backgrounds=backgrounds.get(type),type=type)
             output.settings.pop('backgrounds')
-        client.database.set_server_info(serverid,**output.settings)
+        yield from client.database.set_server_info(serverid,**output.settings)
     if output.delete_command == True:
         yield from client.delete_message(msg)
     if output.typing == True:
@@ -493,7 +600,7 @@ def commandHandler(client, command, msg, serversettings):
     if output.noPermission != None:
         yield from noPermission(client, msg,output.noPermission,serversettings)
     if output.file != None:
-        response = yield from client.send_file(msg.channel,output.file,content=output.content)
+        response = yield from client.send_file(msg.channel,output.file,filename=output.filename,content=output.content)
     elif output.embeds != None:
         for embed in output.embeds:
             response = yield from client.send_message(msg.channel,embed=embed)
@@ -506,7 +613,7 @@ def commandHandler(client, command, msg, serversettings):
                 logger.error('Error sending embed %s', json.dumps(output.embed.to_dict()))
             response = yield from client.send_message(msg.channel,content='Sorry there was an error sending response')
     if output.is_help == True:
-        client.database.set_server_info(serverid,last_help_msg=response.id,last_help_channel=response.channel.id)
+        yield from client.database.set_server_info(serverid,last_help_msg=response.id,last_help_channel=response.channel.id)
 @asyncio.coroutine
 def noPermission(client, msg,type,settings):
     locale = settings.get('locale')
@@ -528,26 +635,27 @@ def commandStatus(msg,settings):
     '<@!{0}> bot v{1} is online!'.format(msg.author.id,VERSION)
 
 class Shard(discord.Client):
-    def __init__(self,*,id=0,count=1,input=None,output=None):
+    def __init__(self,*,id=0,count=1,beat=None):
         super().__init__(shard_id=id,shard_count=count,loop=asyncio.new_event_loop(),max_messages=100)
         self.queued_actions = []
-        self.input = input
-        self.output = output
-        self.database = sql.Database(False, url=DATABASE_URL)
+        self.beat = beat
+        self.database = aiosql.AsyncDatabase(sql.Database(False, url=DATABASE_URL, cache_ttl=SETTINGS_CACHE_TTL), loop=self.loop, workers=DATABASE_WORKERS)
+        shared.configure(self.database.database)
+        self.holder = '{0}-shard{1}'.format(shared.CACHE.holder,id)
+        self.leader = False
+        self.elected = asyncio.Event(loop=self.loop)
+        self.started = int(now()*1000)
+        self.event_versions = {}
+        self.message_counts = {'accepted':0,'filtered':0}
+        self.message_counts_logged = now()
 
     @asyncio.coroutine
-    def threadRequest(self, request):
-        if isinstance(request,transportDefs.ThreadRequest):
-            id = request.requestId
-            self.output.put(request)
-            while 1:
-                resp = self.input.getId(id)
-                if resp is not None:
-                    return resp
-                yield from asyncio.sleep(0.1)
-        else:
-            raise RuntimeError('Must provide a valid thread request')
-        return None
+    def close(self):
+        if self.leader:
+            self.leader = False
+            yield from shared.CACHE.release(shared.FETCHER_LEASE,holder=self.holder)
+        yield from http.close(self.loop)
+        yield from super().close()
 
     @asyncio.coroutine
     def on_reaction_add(self, reaction,user):
@@ -563,23 +671,44 @@ class Shard(discord.Client):
 
     @asyncio.coroutine
     def on_message(self, msg):
-        settings = self.database.server_info(msg.server.id,channels=True,backgrounds=True)
+        if msg.author.bot or msg.server is None:
+            self.count_message(False)
+            return
+        prefix = self.database.cached_prefix(msg.server.id)
+        if prefix is not None and not self.dispatcher.candidate(msg.content,get_prefix({'prefix':prefix or None}),{'prefix':prefix or None}):
+            self.count_message(False)
+            return
+        settings = yield from self.database.server_info(msg.server.id,channels=True,backgrounds=True)
         if settings == None:
             prefix = DEFAULT_PREFIX
         else:
             prefix = settings.get("prefix")
             if prefix == None:
                 prefix = DEFAULT_PREFIX
-        if not msg.author.bot:
-            if msg.content.startswith(prefix):
-                command = msg.content[len(prefix):]
-            else:
-                command = None
-            yield from commandHandler(self, command,msg,settings)
+        if not self.dispatcher.candidate(msg.content,prefix,settings or {}):
+            self.count_message(False)
+            return
+        self.count_message(True)
+        if msg.content.startswith(prefix):
+            command = msg.content[len(prefix):]
+        else:
+            command = None
+        yield from commandHandler(self, command,msg,settings)
+
+    def count_message(self,accepted):
+        """Counts messages that reached commandHandler against those filtered out, logging the totals every so often"""
+        self.message_counts['accepted' if accepted else 'filtered'] += 1
+        if self.message_counts_logged + MESSAGE_STATS_INTERVAL < now():
+            self.message_counts_logged = now()
+            logging.getLogger('on_message').info('Shard %d messages accepted: %d filtered: %d', self.shard_id, self.message_counts['accepted'], self.message_counts['filtered'])
 
     def run(self):
         self.cmodules = [fortnite.FortniteModule(KEY_FNBR, KEY_TRACKERNETWORK, self.database), moderation.ModerationModule()]
         self.defaultmodule = default.DefaultModule(self.cmodules, VERSION, database=self.database)
+        self.dispatcher = dispatch.Dispatcher(self.cmodules)
+        if self.beat is not None:
+            self.loop.create_task(debugger(self,heartbeat))
+        self.loop.create_task(debugger(self,elect))
         self.loop.create_task(debugger(self,autostatus))
         self.loop.create_task(debugger(self,autonews))
         self.loop.create_task(debugger(self,autocheatsheets))
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncDatabase:
+    """Wraps a sql.Database so every method is a coroutine run on a thread pool instead of blocking the event loop"""
+    def __init__(self,database,*,loop=None,workers=4):
+        self.database = database
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+    def __getattr__(self,name):
+        attr = getattr(self.database,name)
+        if not callable(attr):
+            return attr
+        @asyncio.coroutine
+        def method(*args,**kwargs):
+            result = yield from self.run(attr,*args,**kwargs)
+            return result
+        method.__name__ = name
+        return method
+    @asyncio.coroutine
+    def run(self,function,*args,**kwargs):
+        loop = self.loop
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        result = yield from loop.run_in_executor(self.executor,functools.partial(function,*args,**kwargs))
+        return result
+    @asyncio.coroutine
+    def server_info(self,serverid,backgrounds=False,channels=False,cached=True):
+        if cached:
+            info = self.database.settings_cache.get(serverid)
+            if info is None:
+                info = yield from self.run(self.database.load_server_info,serverid)
+        else:
+            info = yield from self.run(self.database.server_info,serverid,backgrounds,channels,False)
+        return info
+    def cached_prefix(self,serverid):
+        """serverid's prefix ('' if it hasn't set one) when its settings are cached, None when they aren't"""
+        return self.database.settings_cache.peek(serverid,lambda info: info.get('prefix') or '')
+    def cache_stats(self):
+        return self.database.cache_stats()
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,98 @@
+import threading
+import copy
+from time import time as now
+
+class TimedCache:
+    """Thread safe store where entries expire ttl seconds after being written"""
+    def __init__(self,ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+        self._purged = now()
+        # write counter and the (count, time) of the last write to each key, so loads that raced a write don't cache stale values
+        self._writes = 0
+        self._written = {}
+        self._cleared = 0
+    def get(self,key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < now():
+                self._data.pop(key,None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+    def version(self):
+        """Token to take before loading a value from its source, pass it to put as since"""
+        with self._lock:
+            return self._writes
+    def put(self,key,value,since=None):
+        """Stores value for key, unless key was written to after the since token was taken"""
+        with self._lock:
+            if since is not None and max(self._written.get(key,(0,))[0],self._cleared) > since:
+                return False
+            self._data[key] = (now()+self.ttl,copy.deepcopy(value))
+            if self._purged + self.ttl < now():
+                self.purge()
+            return True
+    def written(self,key):
+        """Records a write to key's source, called with the lock held"""
+        self._writes += 1
+        self._written[key] = (self._writes,now())
+    def purge(self):
+        """Drops expired entries, called with the lock held at most once per ttl so servers the shard no longer sees don't stay cached"""
+        self._purged = now()
+        self._data = {key: entry for key, entry in self._data.items() if entry[0] >= self._purged}
+        self._written = {key: write for key, write in self._written.items() if write[1] + self.ttl >= self._purged}
+    def peek(self,key,function,default=None):
+        """function applied to the cached value of key without copying it, default on a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now():
+                return default
+            return function(entry[1])
+    def update(self,key,function):
+        """Apply function to the cached value of key in place, does nothing on a miss"""
+        with self._lock:
+            self.written(key)
+            entry = self._data.get(key)
+            if entry is not None:
+                function(entry[1])
+    def invalidate(self,key):
+        with self._lock:
+            self.written(key)
+            self._data.pop(key,None)
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._cleared = self._writes
+            self._data = {}
+    def __len__(self):
+        return len(self._data)
+    @property
+    def stats(self):
+        with self._lock:
+            return {'hits':self.hits,'misses':self.misses,'size':len(self._data)}
+
+class SeenCache:
+    """Thread safe in memory mirror of keys known to be in the seen_items table, grouped by type"""
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+    def unseen(self,type,keys):
+        with self._lock:
+            seen = self._data.get(type,set())
+            return [key for key in keys if not key in seen]
+    def add(self,type,keys):
+        with self._lock:
+            self._data.setdefault(type,set()).update(keys)
+    def clear(self,type=None):
+        with self._lock:
+            if type is None:
+                self._data = {}
+            else:
+                self._data.pop(type,None)
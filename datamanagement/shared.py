@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import time as now
+from utils.singleflight import SingleFlight
+
+# seconds a producer holds the lease for a key and how often the others check for its result
+LEASE_TTL = 60
+WAIT_INTERVAL = 0.5
+# lease held by the one shard that polls upstream and publishes events for the others
+FETCHER_LEASE = 'fetcher'
+# how many of a topic's events are kept for shards that check less often than they're published
+EVENT_HISTORY = 10
+EVENT_TTL = 60*60*24
+
+class MemoryBackend:
+    """In process stand in for sql.Database's shared cache and lease methods"""
+    def __init__(self):
+        self.values = {}
+        self.leases = {}
+        self._lock = threading.Lock()
+    def get_shared(self,key):
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None or entry[1] < now():
+                return None
+            return entry[0]
+    def put_shared(self,key,value,ttl):
+        with self._lock:
+            self.values[key] = (value,now()+ttl)
+    def prune_shared(self):
+        with self._lock:
+            self.values = {key: entry for key, entry in self.values.items() if entry[1] >= now()}
+    def acquire_lease(self,name,holder,ttl):
+        with self._lock:
+            lease = self.leases.get(name)
+            if lease is None or lease[0] == holder or lease[1] < now():
+                self.leases[name] = (holder,now()+ttl)
+                return True
+            return False
+    def release_lease(self,name,holder):
+        with self._lock:
+            if self.leases.get(name,(None,))[0] == holder:
+                self.leases.pop(name)
+
+class SharedCache:
+    """Upstream payloads and rendered images shared by every shard, the first to miss a key leases it and produces the value while the rest wait for it"""
+    def __init__(self,backend=None,workers=2):
+        self.backend = backend or MemoryBackend()
+        self.holder = '{0}-{1}-{2}'.format(socket.gethostname(),os.getpid(),uuid.uuid4().hex[:8])
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.inflight = SingleFlight()
+    def configure(self,backend):
+        self.backend = backend
+    @asyncio.coroutine
+    def call(self,name,*args):
+        """Runs a backend method on the cache's thread pool so a database backend doesn't block the loop"""
+        loop = asyncio.get_event_loop()
+        result = yield from loop.run_in_executor(self.executor,getattr(self.backend,name),*args)
+        return result
+    @asyncio.coroutine
+    def get(self,key):
+        value = yield from self.call('get_shared',key)
+        return value
+    @asyncio.coroutine
+    def put(self,key,value,ttl):
+        yield from self.call('put_shared',key,value,ttl)
+    @asyncio.coroutine
+    def acquire(self,name,ttl=LEASE_TTL,holder=None):
+        acquired = yield from self.call('acquire_lease',name,holder or self.holder,ttl)
+        return acquired
+    @asyncio.coroutine
+    def release(self,name,holder=None):
+        yield from self.call('release_lease',name,holder or self.holder)
+    @asyncio.coroutine
+    def prune(self):
+        yield from self.call('prune_shared')
+    @asyncio.coroutine
+    def fetch(self,key,producer,ttl,lease=LEASE_TTL):
+        """Bytes for key, calling the coroutine function producer only if no other shard is already producing them"""
+        value = yield from self.inflight.do(key,self.fetch_shared,key,producer,ttl,lease)
+        return value
+    @asyncio.coroutine
+    def fetch_shared(self,key,producer,ttl,lease):
+        logger = logging.getLogger('shared-cache')
+        deadline = now() + lease
+        while True:
+            value = yield from self.get(key)
+            if value is not None:
+                return value
+            acquired = yield from self.acquire('cache:'+key,lease)
+            if acquired:
+                break
+            if now() > deadline:
+                logger.warning('Gave up waiting for %s, producing it here',key)
+                break
+            yield from asyncio.sleep(WAIT_INTERVAL)
+        try:
+            value = yield from producer()
+            if value is not None:
+                yield from self.put(key,value,ttl)
+        finally:
+            if acquired:
+                yield from self.release('cache:'+key)
+        return value
+    @asyncio.coroutine
+    def fetch_json(self,key,producer,ttl,lease=LEASE_TTL):
+        """fetch for producers returning json serialisable data"""
+        @asyncio.coroutine
+        def encoded():
+            data = yield from producer()
+            return json.dumps(data).encode('utf-8')
+        value = yield from self.fetch(key,encoded,ttl,lease)
+        return json.loads(value.decode('utf-8'))
+    @asyncio.coroutine
+    def publish(self,topic,data,ttl=EVENT_TTL):
+        """Appends data to topic's recent events and returns its version, only the fetcher should publish"""
+        events = yield from self.events(topic)
+        version = int(now()*1000)
+        if len(events) > 0:
+            version = max(version,events[-1][0]+1)
+        events = (events + [[version,data]])[-EVENT_HISTORY:]
+        yield from self.put('events:'+topic,json.dumps(events).encode('utf-8'),ttl)
+        return version
+    @asyncio.coroutine
+    def events(self,topic,since=0):
+        """[version, data] pairs published to topic after version since, oldest first"""
+        value = yield from self.get('events:'+topic)
+        if value is None:
+            return []
+        return [event for event in json.loads(value.decode('utf-8')) if event[0] > since]
+
+# process wide cache, in memory until a shard configures it with its database
+CACHE = SharedCache()
+
+def configure(backend):
+    CACHE.configure(backend)
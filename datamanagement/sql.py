@@ -1,13 +1,21 @@
 from postgres import Postgres
 import traceback
 
+from . import cache
+
 class Table:
     def __init__(self,name,if_not_exists=False):
         self.name = name
         self.if_not_exists = if_not_exists
         self.columns = []
-    def add_column(self, name, type='int', unique=False, not_null=False, primary_key=False,generate=False):
-        self.columns.append(Column(name,type,unique,not_null,primary_key,generate))
+        self.indexes = []
+    def add_column(self, name, type='int', unique=False, not_null=False, primary_key=False,generate=False,default=None):
+        self.columns.append(Column(name,type,unique,not_null,primary_key,generate,default))
+    def add_index(self,*columns,unique=False,name=None):
+        self.indexes.append(Index(self.name,columns,unique,name))
+    def add_unique(self,*columns,name=None):
+        """Composite unique constraint, stored as a unique index so ON CONFLICT can infer it"""
+        self.add_index(*columns,unique=True,name=name)
     @property
     def column_names(self):
         names = []
@@ -50,18 +58,26 @@ class Table:
         if string.endswith(","):
             string = string[0:-1]
         return string
+    def create_indexes(self):
+        statements = []
+        for index in self.indexes:
+            statements.append(index.create())
+        return statements
 
 
 class Column:
-    def __init__(self, name, type='int', unique=False, not_null=False, primary_key=False, generate=False):
+    def __init__(self, name, type='int', unique=False, not_null=False, primary_key=False, generate=False, default=None):
         self.name = name
         self.type = type
         self.unique = unique
         self.not_null = not_null
         self.primary_key = primary_key
         self.generate = generate
+        self.default = default
     def __str__(self):
         string = " "+self.type
+        if self.default is not None:
+            string += " DEFAULT "+str(self.default)
         if self.unique:
             string += " UNIQUE"
         if self.not_null:
@@ -74,6 +90,23 @@ class Column:
     def named(self):
         return self.name+str(self)
 
+class Index:
+    def __init__(self, table, columns, unique=False, name=None):
+        self.table = table
+        self.columns = list(columns)
+        self.unique = unique
+        if name is None:
+            name = "{}_{}_{}".format(table,"_".join(self.columns),"key" if unique else "idx")
+        self.name = name
+    def create(self):
+        string = "CREATE"
+        if self.unique:
+            string += " UNIQUE"
+        string += " INDEX IF NOT EXISTS "+self.name
+        string += " ON "+self.table
+        string += " ("+",".join(self.columns)+")"
+        return string
+
 class ServerData(Table):
     def __init__(self):
         super().__init__("server_data",True)
@@ -89,6 +122,10 @@ class ServerData(Table):
         self.add_column("prefix",type="text")
         self.add_column("locale",type="text")
         self.add_column("last_seen",type="int")
+        self.add_column("priority",type="int",default=0)
+        self.add_column("premium",type="boolean",default="false")
+        self.add_index("priority")
+        self.add_index("last_seen")
 class ServerBackgrounds(Table):
     def __init__(self):
         super().__init__("server_backgrounds",True)
@@ -96,6 +133,7 @@ class ServerBackgrounds(Table):
         self.add_column("server_id",type="text",not_null=True)
         self.add_column('background_type',type='text')
         self.add_column("background_url",type="text")
+        self.add_index("server_id","background_type")
 class ServerChannels(Table):
     def __init__(self):
         super().__init__("server_channels",True)
@@ -103,12 +141,15 @@ class ServerChannels(Table):
         self.add_column("server_id",type="text",not_null=True)
         self.add_column("channel_type",type="text",not_null=True)
         self.add_column("channel_id",type="text")
+        self.add_unique("server_id","channel_type")
+        self.add_index("channel_type")
 class Cache(Table):
     def __init__(self):
         super().__init__("cache_data",True)
         self.add_column("_id",type="int",primary_key=True,generate=True)
         self.add_column("type",type="text",not_null=True)
         self.add_column("value",type="text")
+        self.add_index("type")
 class Links(Table):
     def __init__(self):
         super().__init__("user_links",True)
@@ -116,23 +157,180 @@ class Links(Table):
         self.add_column('user_id',type='text',unique=True)
         self.add_column('user_nickname',type='text')
         self.add_column('user_platform',type='text')
+class SeenItems(Table):
+    def __init__(self):
+        super().__init__("seen_items",True)
+        self.add_column("_id",type="int",primary_key=True,generate=True)
+        self.add_column("type",type="text",not_null=True)
+        self.add_column("key",type="text",not_null=True)
+        self.add_column("seen",type="int")
+        self.add_unique("type","key")
+        self.add_index("type","seen")
+class SharedCache(Table):
+    def __init__(self):
+        super().__init__("shared_cache",True)
+        self.add_column("key",type="text",primary_key=True)
+        self.add_column("value",type="bytea")
+        self.add_column("expires",type="int",not_null=True)
+        self.add_index("expires")
+class Leases(Table):
+    def __init__(self):
+        super().__init__("leases",True)
+        self.add_column("name",type="text",primary_key=True)
+        self.add_column("holder",type="text",not_null=True)
+        self.add_column("expires",type="int",not_null=True)
+class SchemaMigrations(Table):
+    def __init__(self):
+        super().__init__("schema_migrations",True)
+        self.add_column("version",type="int",primary_key=True)
+        self.add_column("description",type="text")
+        self.add_column("applied",type="int")
+
+# the current schema, which the frozen migrations below must add up to
+TABLES = [ServerData, ServerBackgrounds, ServerChannels, Cache, Links, SeenItems, SharedCache, Leases]
+
+class Migration:
+    def __init__(self,version,description,statements,ignore_errors=False):
+        self.version = version
+        self.description = description
+        self.ignore_errors = ignore_errors
+        self._statements = statements
+    def statements(self):
+        if callable(self._statements):
+            return self._statements()
+        return self._statements
+
+# the statements each migration ran when it was recorded, frozen so a fresh database and an upgraded one end
+# up with the same schema at every version; schema changes to the tables above need a new migration
+SCHEMA_V1 = [
+    "CREATE TABLE IF NOT EXISTS server_data (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,server_id text UNIQUE NOT NULL,server_name text,last_help_msg text,last_help_channel text,last_status_msg text,last_status_channel text,next_shop int,latest_shop text,prefix text,locale text,last_seen int,priority int DEFAULT 0,premium boolean DEFAULT false)",
+    "ALTER TABLE IF EXISTS server_data ADD COLUMN IF NOT EXISTS _id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,"
+    " ALTER COLUMN _id SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS server_id text UNIQUE NOT NULL,"
+    " ALTER COLUMN server_id SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS server_name text,"
+    " ALTER COLUMN server_name SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS last_help_msg text,"
+    " ALTER COLUMN last_help_msg SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS last_help_channel text,"
+    " ALTER COLUMN last_help_channel SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS last_status_msg text,"
+    " ALTER COLUMN last_status_msg SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS last_status_channel text,"
+    " ALTER COLUMN last_status_channel SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS next_shop int,"
+    " ALTER COLUMN next_shop SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS latest_shop text,"
+    " ALTER COLUMN latest_shop SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS prefix text,"
+    " ALTER COLUMN prefix SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS locale text,"
+    " ALTER COLUMN locale SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS last_seen int,"
+    " ALTER COLUMN last_seen SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS priority int DEFAULT 0,"
+    " ALTER COLUMN priority SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS premium boolean DEFAULT false,"
+    " ALTER COLUMN premium SET DATA TYPE boolean",
+    "CREATE TABLE IF NOT EXISTS server_backgrounds (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,server_id text NOT NULL,background_type text,background_url text)",
+    "ALTER TABLE IF EXISTS server_backgrounds ADD COLUMN IF NOT EXISTS _id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,"
+    " ALTER COLUMN _id SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS server_id text NOT NULL,"
+    " ALTER COLUMN server_id SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS background_type text,"
+    " ALTER COLUMN background_type SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS background_url text,"
+    " ALTER COLUMN background_url SET DATA TYPE text",
+    "CREATE TABLE IF NOT EXISTS server_channels (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,server_id text NOT NULL,channel_type text NOT NULL,channel_id text)",
+    "ALTER TABLE IF EXISTS server_channels ADD COLUMN IF NOT EXISTS _id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,"
+    " ALTER COLUMN _id SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS server_id text NOT NULL,"
+    " ALTER COLUMN server_id SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS channel_type text NOT NULL,"
+    " ALTER COLUMN channel_type SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS channel_id text,"
+    " ALTER COLUMN channel_id SET DATA TYPE text",
+    "CREATE TABLE IF NOT EXISTS cache_data (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,type text NOT NULL,value text)",
+    "ALTER TABLE IF EXISTS cache_data ADD COLUMN IF NOT EXISTS _id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,"
+    " ALTER COLUMN _id SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS type text NOT NULL,"
+    " ALTER COLUMN type SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS value text,"
+    " ALTER COLUMN value SET DATA TYPE text",
+    "CREATE TABLE IF NOT EXISTS user_links (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,user_id text UNIQUE,user_nickname text,user_platform text)",
+    "ALTER TABLE IF EXISTS user_links ADD COLUMN IF NOT EXISTS _id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,"
+    " ALTER COLUMN _id SET DATA TYPE int,"
+    " ADD COLUMN IF NOT EXISTS user_id text UNIQUE,"
+    " ALTER COLUMN user_id SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS user_nickname text,"
+    " ALTER COLUMN user_nickname SET DATA TYPE text,"
+    " ADD COLUMN IF NOT EXISTS user_platform text,"
+    " ALTER COLUMN user_platform SET DATA TYPE text",
+]
+
+SCHEMA_V4 = [
+    "CREATE INDEX IF NOT EXISTS server_data_priority_idx ON server_data (priority)",
+    "CREATE INDEX IF NOT EXISTS server_data_last_seen_idx ON server_data (last_seen)",
+    "CREATE INDEX IF NOT EXISTS server_backgrounds_server_id_background_type_idx ON server_backgrounds (server_id,background_type)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS server_channels_server_id_channel_type_key ON server_channels (server_id,channel_type)",
+    "CREATE INDEX IF NOT EXISTS server_channels_channel_type_idx ON server_channels (channel_type)",
+    "CREATE INDEX IF NOT EXISTS cache_data_type_idx ON cache_data (type)",
+]
+
+MIGRATIONS = [
+    Migration(1,'Create tables',SCHEMA_V1,ignore_errors=True),
+    Migration(2,'Add priority and premium columns',[
+        "ALTER TABLE IF EXISTS server_data ADD COLUMN IF NOT EXISTS priority int DEFAULT 0, ADD COLUMN IF NOT EXISTS premium boolean DEFAULT false"
+    ]),
+    Migration(3,'Remove duplicate server channels',[
+        "DELETE FROM server_channels a USING server_channels b WHERE a.server_id=b.server_id AND a.channel_type=b.channel_type AND a._id<b._id"
+    ]),
+    Migration(4,'Add lookup indexes',SCHEMA_V4),
+    Migration(5,'Move news history to seen_items',[
+        "CREATE TABLE IF NOT EXISTS seen_items (_id int PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,type text NOT NULL,key text NOT NULL,seen int)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS seen_items_type_key_key ON seen_items (type,key)",
+        "CREATE INDEX IF NOT EXISTS seen_items_type_seen_idx ON seen_items (type,seen)",
+        "INSERT INTO seen_items (type,key,seen) SELECT DISTINCT 'news',value,extract(epoch from now())::int FROM cache_data WHERE type='news' AND value IS NOT NULL ON CONFLICT (type,key) DO NOTHING",
+        "DELETE FROM cache_data WHERE type='news'"
+    ]),
+    Migration(6,'Add shared cache and leases',[
+        "CREATE TABLE IF NOT EXISTS shared_cache (key text PRIMARY KEY,value bytea,expires int NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS leases (name text PRIMARY KEY,holder text NOT NULL,expires int NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS shared_cache_expires_idx ON shared_cache (expires)"
+    ])
+]
+MIGRATION_LOCK = 7463201
 
 class Database(Postgres):
-    def __init__(self,defaults=False,*,url):
+    def __init__(self,defaults=False,*,url,cache_ttl=300):
         super().__init__(url)
+        self.settings_cache = cache.TimedCache(cache_ttl)
+        self.seen_cache = cache.SeenCache()
         if defaults:
             self.setup_defaults()
     def setup_defaults(self):
-        self.run_unsafe(ServerData().create())
-        self.run_unsafe(ServerData().alter())
-        self.run_unsafe(ServerBackgrounds().create())
-        self.run_unsafe(ServerBackgrounds().alter())
-        self.run_unsafe(ServerChannels().create())
-        self.run_unsafe(ServerChannels().alter())
-        self.run_unsafe(Cache().create())
-        self.run_unsafe(Cache().alter())
-        self.run_unsafe(Links().create())
-        self.run_unsafe(Links().alter())
+        """Apply every migration in MIGRATIONS that has not been recorded in schema_migrations"""
+        self.run(SchemaMigrations().create())
+        for migration in MIGRATIONS:
+            self.migrate(migration)
+    def migrate(self,migration):
+        with self.get_cursor() as cursor:
+            cursor.run("SELECT pg_advisory_xact_lock(%(lock)s)",{'lock':MIGRATION_LOCK})
+            applied = cursor.one("SELECT version FROM schema_migrations WHERE version=%(version)s",{'version':migration.version})
+            if applied is None:
+                for statement in migration.statements():
+                    if migration.ignore_errors:
+                        cursor.run("SAVEPOINT migration_statement")
+                        try:
+                            cursor.run(statement)
+                        except:
+                            traceback.print_exc()
+                            cursor.run("ROLLBACK TO SAVEPOINT migration_statement")
+                    else:
+                        cursor.run(statement)
+                cursor.run("INSERT INTO schema_migrations (version,description,applied) VALUES (%(version)s,%(description)s,extract(epoch from now())::int)",
+                    {'version':migration.version,'description':migration.description})
+                print('Applied migration {} {}'.format(migration.version,migration.description))
     def run_unsafe(self,*args):
         try:
             self.run(*args)
@@ -146,40 +344,61 @@ class Database(Postgres):
         for server in info:
             server_ids.append(server)
         return server_ids
-    def server_info(self,serverid,backgrounds=False,channels=False):
-        info = self.one("SELECT * FROM server_data WHERE server_id=%(id)s",
-            parameters={'id': serverid},
-            back_as=dict,
-            default=None)
-        if info == None:
+    def server_info(self,serverid,backgrounds=False,channels=False,cached=True):
+        if cached:
+            info = self.settings_cache.get(serverid)
+            if info is None:
+                info = self.load_server_info(serverid)
+            return info
+        info = self.server_info_many([serverid],backgrounds=backgrounds,channels=channels,cached=False).get(serverid)
+        if info is None:
             info = {}
-        if backgrounds:
-            backgrounds_data = self.all("SELECT background_type,background_url FROM server_backgrounds WHERE server_id=%(id)s",
-            parameters={'id':serverid},
-            back_as=dict)
-            info['backgrounds'] = {}
-            for background in backgrounds_data:
-                type = background['background_type']
-                if info['backgrounds'].get(type,None) == None:
-                    info['backgrounds'][type] = [background['background_url']]
-                else:
-                    info['backgrounds'][type].append(background['background_url'])
-        if channels:
-            channels_data = self.all("SELECT * FROM server_channels WHERE server_id=%(id)s",
-            parameters={'id':serverid},
-            back_as=dict)
-            info['channels'] = {}
-            for channel in channels_data:
-                info['channels'][channel['channel_type']] = channel['channel_id']
         return info
+    def load_server_info(self,serverid):
+        """Fetch full settings for serverid from the database and store them in the settings cache"""
+        since = self.settings_cache.version()
+        info = self.server_info(serverid,backgrounds=True,channels=True,cached=False)
+        self.settings_cache.put(serverid,info,since)
+        return info
+    def server_info_many(self,server_ids,backgrounds=True,channels=True,cached=True):
+        """Fetch settings for every server in server_ids with one query, returns {server_id: info}"""
+        servers = {}
+        missing = []
+        for server_id in server_ids:
+            info = None
+            if cached:
+                info = self.settings_cache.get(server_id)
+            if info is None:
+                missing.append(server_id)
+            else:
+                servers[server_id] = info
+        if len(missing) > 0:
+            if cached:
+                backgrounds = True
+                channels = True
+            since = self.settings_cache.version()
+            rows = self.all(server_info_query(backgrounds,channels),parameters={'ids':missing},back_as=dict)
+            for row in rows:
+                info = parse_server_row(row,backgrounds,channels)
+                servers[row['server_id']] = info
+                if cached:
+                    self.settings_cache.put(row['server_id'],info,since)
+        return servers
     def set_server_info(self,server_id,**kwargs):
         #print("set_server_info: server_id: {server_id}, server_name: {server_name}, last_help_msg: {last_help_msg}, last_help_channel: {last_help_channel}, next_shop: {next_shop}, latest_shop: {latest_shop}, prefix: {prefix}, last_status_msg: {last_status_msg}, last_status_channel: {last_status_channel}".format_map(ArgMap(kwargs)))
-        if not self.is_server(server_id):
-            self.run("INSERT INTO server_data (server_id) VALUES (%(id)s)",parameters={'id':server_id})
         cols = ServerData().column_names
+        values = {}
         for arg in kwargs:
-            if arg in cols:
-                self.set_server_info_string(server_id, arg, kwargs.get(arg))
+            if arg in cols and arg != '_id' and arg != 'server_id':
+                values[arg] = kwargs.get(arg)
+        parameters = {'id':server_id}
+        for column in values:
+            parameters['v_'+column] = values[column]
+        created = self.one(server_upsert_query(values),parameters=parameters,default=False)
+        if created:
+            self.settings_cache.invalidate(server_id)
+        else:
+            self.settings_cache.update(server_id,lambda info: info.update(values))
     def set_server_info_string(self,server_id,column,value):
         self.set_server_info_raw(server_id,column,value,"s")
     def set_server_info_int(self,server_id,column,value):
@@ -198,6 +417,31 @@ class Database(Postgres):
         self.run("DELETE FROM server_data WHERE server_id=%(id)s",parameters={'id':server_id})
         self.run("DELETE FROM server_channels WHERE server_id=%(id)s",parameters={'id':server_id})
         self.run("DELETE FROM server_backgrounds WHERE server_id=%(id)s",parameters={'id':server_id})
+        self.settings_cache.invalidate(server_id)
+    def delete_servers(self,server_ids):
+        server_ids = list(set(server_ids))
+        if len(server_ids) > 0:
+            parameters = {'ids':server_ids}
+            self.run("DELETE FROM server_data WHERE server_id = ANY(%(ids)s)",parameters=parameters)
+            self.run("DELETE FROM server_channels WHERE server_id = ANY(%(ids)s)",parameters=parameters)
+            self.run("DELETE FROM server_backgrounds WHERE server_id = ANY(%(ids)s)",parameters=parameters)
+            for server_id in server_ids:
+                self.settings_cache.invalidate(server_id)
+    def touch_servers(self,server_ids,last_seen):
+        """Set last_seen for every server in server_ids with one statement, creating rows for servers not yet stored"""
+        server_ids = list(set(server_ids))
+        if len(server_ids) > 0:
+            rows = self.all("INSERT INTO server_data (server_id,last_seen) SELECT unnest(%(ids)s::text[]),%(time)s \
+            ON CONFLICT (server_id) DO UPDATE SET last_seen=EXCLUDED.last_seen RETURNING server_id,(xmax = 0) AS created",
+            parameters={'ids':server_ids,'time':last_seen},
+            back_as=dict)
+            for row in rows:
+                if row['created']:
+                    self.settings_cache.invalidate(row['server_id'])
+                else:
+                    self.settings_cache.update(row['server_id'],lambda info: info.update({'last_seen':last_seen}))
+    def cache_stats(self):
+        return self.settings_cache.stats
     def get_priority_servers(self,priority=0):
         servers = self.all("SELECT server_id,priority FROM server_data WHERE priority=%(priority)s",
         parameters={'priority':priority},
@@ -210,11 +454,13 @@ class Database(Postgres):
     # server backgrounds
     def add_server_background(self,server_id,background_url=None,type=None):
         self.run("INSERT INTO server_backgrounds (server_id,background_type,background_url) VALUES (%(id)s,%(type)s,%(url)s)",parameters={'id':server_id,'url':background_url,'type':type})
+        self.settings_cache.invalidate(server_id)
     def reset_server_backgrounds(self,server_id,type=None):
         if type == None:
             self.run("DELETE FROM server_backgrounds WHERE server_id=%(id)s",parameters={'id':server_id})
         else:
             self.run("DELETE FROM server_backgrounds WHERE server_id=%(id)s AND background_type=%(type)s",parameters={'id':server_id,'type':type})
+        self.settings_cache.invalidate(server_id)
     def set_server_backgrounds(self,server_id,backgrounds=[],type=None):
         self.reset_server_backgrounds(server_id,type)
         for background in backgrounds:
@@ -222,14 +468,21 @@ class Database(Postgres):
 
     # server channels
     def set_server_channel(self,server_id,channel_type,channel_id=None):
+        parameters = {'id':server_id,'type':channel_type,'channel':channel_id}
         if channel_id == None:
-            if self.is_server_channel(server_id,channel_type):
-                self.run("DELETE FROM server_channels WHERE server_id=%(id)s AND channel_type=%(type)s",parameters={'id':server_id,'type':channel_type})
+            self.run("DELETE FROM server_channels WHERE server_id=%(id)s AND channel_type=%(type)s",parameters=parameters)
         else:
-            if self.is_server_channel(server_id,channel_type):
-                self.run("UPDATE server_channels SET channel_id=%(channel)s WHERE server_id=%(id)s AND channel_type=%(type)s",parameters={'id':server_id,'channel':channel_id,'type':channel_type})
-            else:
-                self.run("INSERT INTO server_channels (server_id,channel_type,channel_id) VALUES (%(id)s,%(type)s,%(channel)s)",parameters={'id':server_id,'type':channel_type,'channel':channel_id})
+            self.run(CHANNEL_UPSERT_QUERY,parameters=parameters)
+        self.settings_cache.update(server_id,lambda info: update_channel(info,channel_type,channel_id))
+    def get_channel_subscribers(self,channel_type):
+        """Settings of every server with a channel of channel_type set in one query, returns {server_id: info}"""
+        rows = self.all(CHANNEL_SUBSCRIBERS_QUERY,parameters={'type':channel_type},back_as=dict)
+        servers = {}
+        for row in rows:
+            info = parse_server_row(row,backgrounds=True)
+            info['channels'] = {row['channel_type']: row['channel_id']}
+            servers[row['server_id']] = info
+        return servers
     def is_server_channel(self,server_id,channel_type):
         data = self.one("SELECT _id FROM server_channels WHERE server_id=%(id)s AND channel_type=%(type)s",parameters={'id':server_id,'type':channel_type},default=None)
         exists = False
@@ -269,6 +522,45 @@ class Database(Postgres):
         return exists
 
 
+    # seen items
+    def filter_unseen(self,type,keys):
+        """Returns the keys that have not been marked seen for type, only the candidate keys are queried"""
+        candidates = self.seen_cache.unseen(type,keys)
+        if len(candidates) > 0:
+            seen = self.all("SELECT key FROM seen_items WHERE type=%(type)s AND key = ANY(%(keys)s)",parameters={'type':type,'keys':list(set(candidates))})
+            self.seen_cache.add(type,seen)
+        return self.seen_cache.unseen(type,keys)
+    def mark_seen(self,type,keys,seen):
+        """Marks keys as seen at time seen, refreshing the time of keys that were already stored"""
+        keys = list(set(keys))
+        if len(keys) > 0:
+            self.run("INSERT INTO seen_items (type,key,seen) SELECT %(type)s,unnest(%(keys)s::text[]),%(seen)s ON CONFLICT (type,key) DO UPDATE SET seen=EXCLUDED.seen",
+            parameters={'type':type,'keys':keys,'seen':seen})
+            self.seen_cache.add(type,keys)
+    def prune_seen(self,type,before):
+        self.run("DELETE FROM seen_items WHERE type=%(type)s AND seen<%(before)s",parameters={'type':type,'before':before})
+        self.seen_cache.clear(type)
+
+    # shared cache
+    def get_shared(self,key):
+        """Bytes stored under key, None if missing or expired"""
+        value = self.one("SELECT value FROM shared_cache WHERE key=%(key)s AND expires>extract(epoch from now())::int",parameters={'key':key})
+        if value is not None:
+            value = bytes(value)
+        return value
+    def put_shared(self,key,value,ttl):
+        self.run("INSERT INTO shared_cache (key,value,expires) VALUES (%(key)s,%(value)s,extract(epoch from now())::int+%(ttl)s) ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value,expires=EXCLUDED.expires",
+        parameters={'key':key,'value':value,'ttl':ttl})
+    def prune_shared(self):
+        self.run("DELETE FROM shared_cache WHERE expires<extract(epoch from now())::int")
+    def acquire_lease(self,name,holder,ttl):
+        """Takes or renews the lease on name for ttl seconds, returns False while another holder has it"""
+        acquired = self.one("INSERT INTO leases (name,holder,expires) VALUES (%(name)s,%(holder)s,extract(epoch from now())::int+%(ttl)s) ON CONFLICT (name) DO UPDATE SET holder=EXCLUDED.holder,expires=EXCLUDED.expires WHERE leases.holder=EXCLUDED.holder OR leases.expires<extract(epoch from now())::int RETURNING holder",
+        parameters={'name':name,'holder':holder,'ttl':ttl})
+        return acquired is not None
+    def release_lease(self,name,holder):
+        self.run("DELETE FROM leases WHERE name=%(name)s AND holder=%(holder)s",parameters={'name':name,'holder':holder})
+
     # links
     def get_link(self,user_id):
         data = self.all("SELECT * FROM user_links WHERE user_id=%(id)s",parameters={'id':user_id},back_as=dict)
@@ -291,6 +583,58 @@ class Database(Postgres):
         self.run('DELETE FROM user_links WHERE user_id=%(id)s',parameters={'id':user_id})
 
 
+CHANNEL_SUBSCRIBERS_QUERY = "SELECT c.server_id, c.channel_type, c.channel_id, row_to_json(d) AS data, \
+(SELECT json_agg(json_build_object('type',b.background_type,'url',b.background_url) ORDER BY b._id) FROM server_backgrounds b WHERE b.server_id=c.server_id) AS backgrounds \
+FROM server_channels c LEFT JOIN server_data d ON d.server_id=c.server_id WHERE c.channel_type=%(type)s AND c.channel_id IS NOT NULL ORDER BY c._id"
+
+CHANNEL_UPSERT_QUERY = "INSERT INTO server_channels (server_id,channel_type,channel_id) VALUES (%(id)s,%(type)s,%(channel)s) \
+ON CONFLICT (server_id,channel_type) DO UPDATE SET channel_id=EXCLUDED.channel_id"
+
+def server_upsert_query(values):
+    """Single INSERT ... ON CONFLICT statement for server_data, column names must already be validated against ServerData. Returns true when the row was created"""
+    columns = list(values)
+    query = "INSERT INTO server_data (server_id"
+    for column in columns:
+        query += ","+column
+    query += ") VALUES (%(id)s"
+    for column in columns:
+        query += ",%(v_{})s".format(column)
+    query += ") ON CONFLICT (server_id) DO "
+    if len(columns) > 0:
+        query += "UPDATE SET "+",".join("{0}=EXCLUDED.{0}".format(column) for column in columns)
+    else:
+        query += "NOTHING"
+    query += " RETURNING (xmax = 0) AS created"
+    return query
+def server_info_query(backgrounds=False,channels=False):
+    query = "SELECT ids.server_id, row_to_json(d) AS data"
+    if backgrounds:
+        query += ", (SELECT json_agg(json_build_object('type',b.background_type,'url',b.background_url) ORDER BY b._id) FROM server_backgrounds b WHERE b.server_id=ids.server_id) AS backgrounds"
+    if channels:
+        query += ", (SELECT json_agg(json_build_object('type',c.channel_type,'id',c.channel_id) ORDER BY c._id) FROM server_channels c WHERE c.server_id=ids.server_id) AS channels"
+    query += " FROM unnest(%(ids)s::text[]) AS ids(server_id) LEFT JOIN server_data d ON d.server_id=ids.server_id"
+    return query
+def parse_server_row(row,backgrounds=False,channels=False):
+    """Turn a row from server_info_query into the nested dict returned by server_info"""
+    info = row.get('data')
+    if info is None:
+        info = {}
+    if backgrounds:
+        info['backgrounds'] = {}
+        for background in row.get('backgrounds') or []:
+            info['backgrounds'].setdefault(background['type'],[]).append(background['url'])
+    if channels:
+        info['channels'] = {}
+        for channel in row.get('channels') or []:
+            info['channels'][channel['type']] = channel['id']
+    return info
+def update_channel(info,channel_type,channel_id):
+    channels = info.setdefault('channels',{})
+    if channel_id is None:
+        channels.pop(channel_type,None)
+    else:
+        channels[channel_type] = channel_id
+
 class ArgMap(dict):
     def __missing__(self, key):
         return None
@@ -1,11 +1,10 @@
 import asyncio
-import aiohttp
 import bs4
 import html2text
 import logging
 import traceback
 
-from utils import strings
+from utils import strings, http
 
 PATCHNOTES = 'https://www.epicgames.com/fortnite/api/blog/getPosts?category=patch+notes&postsPerPage={0}&offset={1}&locale=en-US'
 
@@ -19,20 +18,21 @@ def getLogger(name):
 def fetch_patch_notes(limit=5,offset=0,detail=True):
     debugger = getLogger('fetch_patch_notes')
     url = PATCHNOTES.format(limit, offset)
-    session = aiohttp.ClientSession()
-    response = yield from session.get(url)
+    response = yield from http.get(url)
     output = {'success': False}
     if response.status == 200:
         data = yield from response.json()
+        yield from response.release()
         if 'blogList' in data:
             output['notes'] = []
             for blog in data['blogList']:
                 url = 'https://www.epicgames.com/fortnite/en-US{0}'.format(blog.get('externalLink','/'))
-                content_response = yield from session.get(url)
+                content_response = yield from http.get(url)
                 if content_response.status == 200:
                     content = yield from content_response.text()
                 else:
                     content = ''
+                yield from content_response.release()
                 note = {
                   'title': blog['title'],
                   'author': blog['author'],
@@ -61,7 +61,7 @@ def fetch_patch_notes(limit=5,offset=0,detail=True):
             output['success'] = True
     else:
         print(response.status_code)
-    yield from session.close()
+        yield from response.release()
     return output
 
 
@@ -1,8 +1,9 @@
 import asyncio
-import aiohttp
 import logging
 import traceback
-from utils import strings
+from utils import strings, http
+
+CHEAT_SHEET_USER = 'thesquatingdog'
 
 class CheatSheet:
     def __init__(self,*,title=None,season=0,week=0,image=None):
@@ -22,14 +23,15 @@ class CheatSheet:
 @asyncio.coroutine
 def get_reddit_posts(user):
     url = 'http://api.reddit.com/user/{0}/submitted/?sort=new'.format(user)
-    session = aiohttp.ClientSession(headers={'User-Agent':'RoyaleBot vX.X.X'})
-    response = yield from session.get(url)
+    response = yield from http.get(url,headers={'User-Agent':'RoyaleBot vX.X.X'})
     json = None
-    if response.status == 200:
-        json = yield from response.json()
-    else:
-        response.raise_for_status()
-    yield from session.close()
+    try:
+        if response.status == 200:
+            json = yield from response.json()
+        else:
+            response.raise_for_status()
+    finally:
+        yield from response.release()
     return json
 
 @asyncio.coroutine
@@ -56,7 +58,7 @@ def parse_cheat_sheets(data):
 
 @asyncio.coroutine
 def get_cheat_sheets():
-    data = yield from get_reddit_posts('thesquatingdog')
+    data = yield from get_reddit_posts(CHEAT_SHEET_USER)
     sheets = yield from parse_cheat_sheets(data)
     return sheets
 
@@ -4,6 +4,8 @@ from urllib.parse import quote_plus
 import re
 import bs4
 import logging
+import threading
+from utils import http
 
 # constants
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:60.0) Gecko/20100101 Firefox/60.0'
@@ -24,6 +26,12 @@ UPCOMING_TYPE = "upcoming"
 
 CSRF_TOKEN = None
 CSRF_COOKIE = aiohttp.CookieJar()
+
+# max seen lookups in flight at once per shop request
+SEEN_CONCURRENCY = 6
+# seen data for the current shop date, shared by all shards
+SEEN_CACHE = {'date':None,'items':{}}
+SEEN_LOCK = threading.Lock()
 # requests
 class APIRequest():
     def __init__(self,key,endpoint,arguments={}):
@@ -42,12 +50,13 @@ class APIRequest():
         return args
     @asyncio.coroutine
     def send(self):
-        client = aiohttp.ClientSession()
         headers = {'x-api-key':self.key}
-        response_data = yield from client.get(url=self.url(),headers=headers)
-        json = yield from response_data.json()
+        response_data = yield from http.get(self.url(),headers=headers)
+        try:
+            json = yield from response_data.json()
+        finally:
+            yield from response_data.release()
         self.response = APIResponse(response_data, json)
-        yield from client.close()
         return self.response
 class Images(APIRequest):
     def __init__(self,key,search=None,type=None,limit=None):
@@ -92,11 +101,12 @@ class ItemList(APIRequest):
         return self.urltouse
     @asyncio.coroutine
     def send(self):
-        client = aiohttp.ClientSession()
-        response_data = yield from client.get(url=self.url())
-        json = yield from response_data.json()
+        response_data = yield from http.get(self.url())
+        try:
+            json = yield from response_data.json()
+        finally:
+            yield from response_data.release()
         self.response = APIResponse(response_data, json)
-        yield from client.close()
         return self.response
 class Seen(APIRequest):
     def __init__(self, id=''):
@@ -109,7 +119,7 @@ class Seen(APIRequest):
     def send(self):
         global CSRF_TOKEN
         global CSRF_COOKIE
-        client = aiohttp.ClientSession(headers=[('User-Agent',USER_AGENT)])
+        headers = {'User-Agent':USER_AGENT}
         # if CSRF_TOKEN is None:
         #     main = yield from client.get('https://fnbr.co')
         #     if main.status == 200:
@@ -125,17 +135,17 @@ class Seen(APIRequest):
         # if CSRF_TOKEN is not None:
         url = self.url()
         # headers = {'csrf-token':CSRF_TOKEN}
-        response = yield from client.get(url)
+        response = yield from http.get(url,headers=headers)
         while response.status != 200 and self.retries < 5:
+            yield from response.release()
             yield from asyncio.sleep(0.1)
             self.retries += 1
-            response = yield from client.get(url)
+            response = yield from http.get(url,headers=headers)
         try:
             json = yield from response.json()
         except:
             json = None
-        response.close()
-        yield from client.close()
+        yield from response.release()
         self.response = APIResponse(response, json)
         return self.response
 class ShopAndSeen:
@@ -146,11 +156,28 @@ class ShopAndSeen:
         shop = Shop(self.key)
         data = yield from shop.send()
         if data.type == SHOP_TYPE:
-            for item in data.data.daily+data.data.featured:
-                seen = Seen(item.id)
-                seen_data = yield from seen.send()
-                item.seen = seen_data.data
+            items = data.data.daily+data.data.featured
+            semaphore = asyncio.Semaphore(SEEN_CONCURRENCY)
+            seen = yield from asyncio.gather(*[self.seen(item.id,data.data.date,semaphore) for item in items])
+            for item, seen_data in zip(items,seen):
+                item.seen = seen_data
         return data
+    @asyncio.coroutine
+    def seen(self,id,date,semaphore):
+        """Seen data for item id, cached until the shop date changes"""
+        with SEEN_LOCK:
+            if SEEN_CACHE['date'] != date:
+                SEEN_CACHE['date'] = date
+                SEEN_CACHE['items'] = {}
+            if id in SEEN_CACHE['items']:
+                return SEEN_CACHE['items'][id]
+        with (yield from semaphore):
+            seen_data = yield from Seen(id).send()
+        if seen_data.type == SEEN_TYPE:
+            with SEEN_LOCK:
+                if SEEN_CACHE['date'] == date:
+                    SEEN_CACHE['items'][id] = seen_data.data
+        return seen_data.data
 # responses
 class APIResponse():
     def __init__(self,response,json):
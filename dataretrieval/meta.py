@@ -2,8 +2,7 @@ import requests
 import bs4
 import html2text
 import asyncio
-import aiohttp
-from utils import strings
+from utils import strings, http
 
 NEWS = 'https://fortnitecontent-website-prod07.ol.epicgames.com/content/api/pages/fortnite-game'
 STATUS = 'https://lightswitch-public-service-prod06.ol.epicgames.com/lightswitch/api/service/bulk/status?serviceId=Fortnite'
@@ -21,10 +20,11 @@ def markdown(html,baseurl=None):
 
 @asyncio.coroutine
 def getStatus():
-    session = aiohttp.ClientSession()
-    response = yield from session.get(STATUS)
-    data = yield from response.json()
-    yield from session.close()
+    response = yield from http.get(STATUS)
+    try:
+        data = yield from response.json()
+    finally:
+        yield from response.release()
     if len(data) > 0:
         data = data[0]
     output = {'online':False,'message':'','services':{}}
@@ -45,20 +45,35 @@ def getStatus():
 
 def getNews(language='en'):
     response = requests.get(NEWS,headers={'Accept-Language':language})
-    output = {'success':False}
     if response.status_code == 200:
-        data = response.json()
-        if 'battleroyalenews' in data:
-            output['updated'] = data['battleroyalenews']['lastModified']
-            output['messages'] = []
-            if 'news' in data['battleroyalenews']:
-                if 'messages' in data['battleroyalenews']['news']:
-                    output['messages'] = data['battleroyalenews']['news']['messages']
-        if 'emergencynotice' in data:
-            if 'news' in data['emergencynotice']:
-                if 'messages' in data['emergencynotice']['news']:
-                    output['messages'] += data['emergencynotice']['news']['messages']
-        output['success'] = True
+        return parseNews(response.json())
+    return {'success':False}
+
+@asyncio.coroutine
+def fetchNews(language='en'):
+    """getNews without blocking the event loop"""
+    response = yield from http.get(NEWS,headers={'Accept-Language':language})
+    try:
+        if response.status == 200:
+            data = yield from response.json()
+            return parseNews(data)
+    finally:
+        yield from response.release()
+    return {'success':False}
+
+def parseNews(data):
+    output = {'success':False}
+    if 'battleroyalenews' in data:
+        output['updated'] = data['battleroyalenews']['lastModified']
+        output['messages'] = []
+        if 'news' in data['battleroyalenews']:
+            if 'messages' in data['battleroyalenews']['news']:
+                output['messages'] = data['battleroyalenews']['news']['messages']
+    if 'emergencynotice' in data:
+        if 'news' in data['emergencynotice']:
+            if 'messages' in data['emergencynotice']['news']:
+                output['messages'] += data['emergencynotice']['news']['messages']
+    output['success'] = True
     return output
 
 def getPatchNotes(limit=5,offset=0,detail=True):
@@ -1,28 +1,37 @@
 from . import trackernetwork
 import asyncio
-import aiohttp
+from utils import http
+from utils.singleflight import SingleFlight
+
+# profile requests in flight by (platform, player)
+LOOKUPS = SingleFlight()
 
 @asyncio.coroutine
-def fetch(session, url):
-    response = yield from session.get(url)
+def fetch(url, headers=None):
+    response = yield from http.get(url, headers=headers)
     return response
 
-@asyncio.coroutine
-def apiSession(apikey):
-    headers = {'TRN-Api-Key':apikey}
-    return aiohttp.ClientSession(headers=headers)
+def apiHeaders(apikey):
+    return {'TRN-Api-Key':apikey}
 
 @asyncio.coroutine
 def stats(key,player='',platform='pc'):
+    """Tracker profile for player, concurrent lookups of the same player share one request"""
+    json = yield from LOOKUPS.do((platform,player),profile,key,player,platform)
+    return json
+
+@asyncio.coroutine
+def profile(key,player,platform):
     url = 'https://api.fortnitetracker.com/v1/profile/{0}/{1}'.format(platform,player)
-    session = yield from apiSession(key)
-    response = yield from fetch(session, url)
-    if response.status == 200:
-        json = yield from response.json()
-        json['status'] = response.status
-    else:
-        json = {'status':response.status,'error':response.reason}
-    yield from session.close()
+    response = yield from fetch(url, apiHeaders(key))
+    try:
+        if response.status == 200:
+            json = yield from response.json()
+            json['status'] = response.status
+        else:
+            json = {'status':response.status,'error':response.reason}
+    finally:
+        yield from response.release()
     return json
 
 
@@ -45,9 +54,8 @@ def getStats(key,name='',platform=''):
 @asyncio.coroutine
 def console_search(platform,query):
     url = 'https://fortnitetracker.com/profile/search?q={0}({1})'.format(platform,query)
-    session = aiohttp.ClientSession()
-    response = yield from session.get(url, allow_redirects=False)
-    yield from session.close()
+    response = yield from http.get(url, allow_redirects=False)
+    yield from response.release()
     location = response.headers.get('Location')
     if location is not None:
         t = location.split('/')
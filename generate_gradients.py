@@ -14,9 +14,7 @@ def generate_gradient(size, gradient):
     gradient: tuple
         must be tuple of two colors
     """
-    image = PIL.Image.new('RGBA', size)
-    draw = PIL.ImageDraw.Draw(image)
-    images.radial_gradient(draw, size[0], size[1], gradient[0], gradient[1])
+    image = images.radial_gradient_image(size, gradient[0], gradient[1])
     return image
 
 
@@ -0,0 +1,152 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import threading
+from io import BytesIO
+from utils import images
+from utils.singleflight import SingleFlight
+from datamanagement import shared
+from . import shop, upcoming, stats
+
+# number of render processes shared by every shard
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+
+EXECUTOR = None
+LOCK = threading.Lock()
+# jobs in flight, identical requests from any shard share one render
+RENDERS = SingleFlight()
+# how long a rendered overlay is shared with the other shard processes
+OVERLAY_SHARE_TTL = 60*60*24
+# event loop of a render process, kept between jobs so the http session is reused
+LOOP = None
+
+OVERLAY_GENERATORS = {
+    'shop': shop.generate_image,
+    'upcoming': upcoming.generate_image
+}
+STATS_GENERATORS = {
+    'regular': stats.generate,
+    'season': stats.generate_season,
+    'performance': stats.generate_performance
+}
+
+def start(workers=RENDER_WORKERS):
+    """Starts the render processes, call before any threads are started so they fork cleanly"""
+    global EXECUTOR
+    with LOCK:
+        if EXECUTOR is None:
+            EXECUTOR = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            EXECUTOR.submit(shop.warm).result()
+            logging.getLogger('render').info('Started %d render processes',workers)
+    return EXECUTOR
+
+def stop():
+    global EXECUTOR
+    with LOCK:
+        if EXECUTOR is not None:
+            EXECUTOR.shutdown()
+            EXECUTOR = None
+
+# jobs, these run inside the render processes so only take and return picklable values
+def run(coroutine):
+    global LOOP
+    if LOOP is None:
+        LOOP = asyncio.new_event_loop()
+        asyncio.set_event_loop(LOOP)
+    return LOOP.run_until_complete(coroutine)
+
+def read_file(filename):
+    with open(filename,'rb') as f:
+        return os.path.basename(filename), f.read()
+
+def png(image,name):
+    if image is None:
+        return None
+    output = BytesIO()
+    image.save(output,'PNG')
+    return name, output.getvalue()
+
+def overlay_job(basename,apikey):
+    return run(images.daily_overlay(OVERLAY_GENERATORS[basename],basename,apikey))[0]
+
+def variant_job(basename,apikey,url):
+    return read_file(run(images.daily_variant(OVERLAY_GENERATORS[basename],basename,url,apikey)))
+
+def shop_job(apikey,serverid,backgrounds):
+    return read_file(run(shop.generate(apikey,serverid,backgrounds)))
+
+def upcoming_job(apikey,serverid,backgrounds):
+    return read_file(run(upcoming.generate(apikey,serverid,backgrounds)))
+
+def stats_job(apikey,player,platform,backgrounds,kind='regular'):
+    image = run(STATS_GENERATORS[kind](apikey,player,platform,backgrounds))
+    name = 'matches.png' if kind == 'performance' else 'stats.png'
+    return png(image,name)
+
+# called from the shards
+@asyncio.coroutine
+def render(job,*args):
+    """Runs job in a render process, returns its (filename, png bytes) result"""
+    key = (job.__name__,repr(args))
+    result = yield from RENDERS.do(key,submit,job,*args)
+    return result
+
+@asyncio.coroutine
+def submit(job,*args):
+    loop = asyncio.get_event_loop()
+    result = yield from loop.run_in_executor(start(),job,*args)
+    return result
+
+@asyncio.coroutine
+def overlay(basename,apikey):
+    """Makes sure today's overlay exists before the per server jobs so the render processes don't all generate it,
+    taking it from the shared cache when another shard process already rendered it"""
+    filename = images.overlay_filename(basename)
+    if not os.path.isfile(filename):
+        data = yield from shared.CACHE.fetch('overlay:'+filename,functools.partial(overlay_bytes,basename,apikey),OVERLAY_SHARE_TTL)
+        if not os.path.isfile(filename):
+            write_atomic(data,filename)
+    return filename
+
+@asyncio.coroutine
+def overlay_bytes(basename,apikey):
+    filename = yield from render(overlay_job,basename,apikey)
+    return read_file(filename)[1]
+
+def write_atomic(data,filename):
+    tmp = '{0}.{1}.tmp'.format(filename,os.getpid())
+    with open(tmp,'wb') as f:
+        f.write(data)
+    os.replace(tmp,filename)
+
+@asyncio.coroutine
+def shop_image(apikey,serverid,backgrounds):
+    yield from overlay('shop',apikey)
+    result = yield from render(shop_job,apikey,serverid,backgrounds)
+    return result
+
+@asyncio.coroutine
+def shop_variants(apikey,servers):
+    """Renders every distinct shop variant servers ((serverid, backgrounds) pairs) need once, returns
+    {serverid: (filename, png bytes)}, or the exception if that variant failed"""
+    yield from overlay('shop',apikey)
+    urls = {serverid: images.pick_background(backgrounds,serverid) for serverid, backgrounds in servers}
+    distinct = list(set(urls.values()))
+    results = yield from asyncio.gather(*[render(variant_job,'shop',apikey,url) for url in distinct],return_exceptions=True)
+    variants = dict(zip(distinct,results))
+    logging.getLogger('render').info('Rendered %d shop variants for %d servers',len(distinct),len(urls))
+    return {serverid: variants[url] for serverid, url in urls.items()}
+
+@asyncio.coroutine
+def upcoming_image(apikey,serverid,backgrounds):
+    yield from overlay('upcoming',apikey)
+    result = yield from render(upcoming_job,apikey,serverid,backgrounds)
+    return result
+
+@asyncio.coroutine
+def stats_image(apikey,player,platform,backgrounds,kind='regular'):
+    """(filename, png bytes) for the player's stats, None if they weren't found"""
+    result = yield from render(stats_job,apikey,player,platform,backgrounds,kind)
+    return result
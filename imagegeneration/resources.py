@@ -0,0 +1,48 @@
+import threading
+import logging
+import PIL.Image
+import PIL.ImageFont
+
+# fonts by (path, size) and frames by path, loaded once per process
+FONTS = {}
+FRAMES = {}
+LOCK = threading.Lock()
+
+def font(path,size):
+    """Shared FreeTypeFont for path at size, fonts are only read so the same object is handed out"""
+    key = (path,size)
+    loaded = FONTS.get(key)
+    if loaded is None:
+        with LOCK:
+            loaded = FONTS.get(key)
+            if loaded is None:
+                loaded = PIL.ImageFont.truetype(path,size)
+                FONTS[key] = loaded
+    return loaded
+
+def frame(path):
+    """Copy of the image at path, raises IOError like PIL.Image.open if it can't be loaded"""
+    loaded = FRAMES.get(path)
+    if loaded is None:
+        with LOCK:
+            loaded = FRAMES.get(path)
+            if loaded is None:
+                loaded = PIL.Image.open(path)
+                loaded.load()
+                FRAMES[path] = loaded
+    return loaded.copy()
+
+def warm(fonts=(),frames=()):
+    """Loads fonts ((path, size) pairs) and frames up front, missing files are logged and skipped"""
+    logger = logging.getLogger('resources')
+    for path, size in fonts:
+        try:
+            font(path,size)
+        except IOError:
+            logger.warning('Unable to load font %s at %d',path,size)
+    for path in frames:
+        try:
+            frame(path)
+        except IOError:
+            logger.warning('Unable to load frame %s',path)
+    logger.debug('Loaded %d fonts and %d frames',len(FONTS),len(FRAMES))
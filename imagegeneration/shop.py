@@ -2,19 +2,33 @@ import PIL.Image
 import PIL.ImageFont
 import PIL.ImageDraw
 from io import BytesIO
-import requests
 from datetime import datetime
 from random import choice
 from utils import arrays, integers, images, times
+from utils.assetcache import ASSETS
 import asyncio
+import os
 from os.path import isfile
+import hashlib
+import threading
+from collections import OrderedDict
+from time import time as now
 import logging
 import traceback
 
 from dataretrieval import fnbr
+from . import resources
 
 FONT = "assets/burbank.ttf"
 NEW_IMG = "assets/new.png"
+FRAMES = ['assets/fortnite_{}_rounded.png'.format(rarity) for rarity in ('uncommon','rare','epic','legendary')]
+PRICE_ICON = 'https://image.fnbr.co/price/icon_vbucks.png'
+# rarity gradient backgrounds by (rarity, size), only generated when the asset is missing
+GRADIENTS = {}
+# rendered item tiles kept in memory, optionally as pngs in TILE_CACHE_DIR for TILE_CACHE_MAX_AGE seconds
+TILE_CACHE_SIZE = int(os.environ.get('TILE_CACHE_SIZE', 64))
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR')
+TILE_CACHE_MAX_AGE = int(os.environ.get('TILE_CACHE_MAX_AGE', 7*24*60*60))
 
 
 class ShopImage:
@@ -22,7 +36,7 @@ class ShopImage:
         self.size = size
         self.padding = padding
         self.fontsize = fontsize
-        self.font = PIL.ImageFont.truetype(FONT,self.fontsize)
+        self.font = resources.font(FONT,self.fontsize)
         self.fheight = self.font.getsize("Tp")[1]
         self.frows = (fcount+(fcount%2))/2
         self.drows = (dcount+(dcount%2))/2
@@ -83,38 +97,32 @@ class ShopImage:
         yield from self.drawText()
         return self.background
 class ItemImage:
-    def __init__(self,itemname,itemprice,itempriceimage,itemrarity,itemimageurl,size,count=0):
+    def __init__(self,itemname,itemprice,itempriceimage,itemrarity,itemimageurl,size,count=0,preloaded=None):
         self.size = size
-        color = (255,255,255,0)
+        self.preloaded = preloaded or {}
         if itemrarity == "uncommon":
-            color = (56, 121, 39, 255)
             gradient = ((96,170,58,255),(23,81,23,255))
             background = 'assets/fortnite_uncommon_rounded.png'
         elif itemrarity == "rare":
-            color = (61,171,245,255)
             gradient = ((73,172,242,255),(20,57,119,255))
             background = 'assets/fortnite_rare_rounded.png'
         elif itemrarity == "epic":
-            color = (199,81,248,255)
             gradient = ((177,91,226,255),(75,36,131,255))
             background = 'assets/fortnite_epic_rounded.png'
         elif itemrarity == "legendary":
-            color = (230,126,34,255)
             gradient = ((211,120,65,255),(120,55,29,255))
             background = 'assets/fortnite_legendary_rounded.png'
         try:
-            self.background = PIL.Image.open(background)
+            self.background = resources.frame(background)
             if self.background.width != self.size or self.background.height != self.size:
                 self.background.resize(self.size)
         except IOError:
-            self.background = PIL.Image.new("RGBA",(self.size,self.size),color)
-            draw = PIL.ImageDraw.Draw(self.background)
-            images.radial_gradient(draw,self.size,self.size,gradient[1],gradient[0])
+            self.background = rarityGradient(itemrarity,self.size,gradient)
         finally:
             draw = PIL.ImageDraw.Draw(self.background)
         fontsize = round(self.size/10)
-        largefont = PIL.ImageFont.truetype(FONT,fontsize+10)
-        smallfont = PIL.ImageFont.truetype(FONT,fontsize-10)
+        largefont = resources.font(FONT,fontsize+10)
+        smallfont = resources.font(FONT,fontsize-10)
         largeheight = largefont.getsize("Test")[1]
         smallheight = smallfont.getsize("test")[1]
         textwidth = largefont.getsize(itemname)[0]
@@ -122,7 +130,7 @@ class ItemImage:
         top = round(self.size - largeheight - smallheight - 15)
         imagesize = round(self.size - largeheight - smallheight - 10)
         imageleft = round((self.size-imagesize)/2)
-        item = createImageFromUrl(itemimageurl).resize((self.size,self.size))
+        item = self.image(itemimageurl).resize((self.size,self.size))
         self.background.paste(item,(0,0),item)
         self.darkenRect(draw,(0,top),(self.size,self.size),35)
         # self.round(25)
@@ -130,19 +138,22 @@ class ItemImage:
         textwidth = 10 + smallheight + smallfont.getsize(itemprice)[0]
         left = round((self.size - textwidth) / 2)
         top = round(top + largeheight + 5)
-        price = createImageFromUrl(itempriceimage).resize((smallheight,smallheight))
+        price = self.image(itempriceimage).resize((smallheight,smallheight))
         self.background.paste(price,(left,top),price)
         left = round(left +smallheight + 5)
         self.borderedText(draw,(left,top),itemprice,smallfont,(255,255,255),(0,0,0))
-        if count > 0:
-            if count == 1:
-                count = 'NEW'
-            else:
-                count = '{} DAYS'.format(count)
-            countimg = CountImage(count).out()
+        badge = countBadge(count)
+        if badge is not None:
+            countimg = CountImage(badge).out()
             x = self.background.width - countimg.width - 10
             y = 10
             self.background.paste(countimg,(x,y),countimg)
+    def image(self,url):
+        """Returns the preloaded image for url, only downloading it if it wasn't fetched up front"""
+        image = self.preloaded.get(url)
+        if image is None:
+            image = createImageFromUrl(url)
+        return image
     def borderedText(self,draw,pos,text,font,textcolor=(255,255,255),bordercolor=(0,0,0)):
         draw.text(pos,text,font=font,fill=textcolor)
     def round(self,size):
@@ -164,25 +175,74 @@ class ItemImage:
         size2 = font2.getsize(text)
         return (size1[0]-size2[0],size1[1]-size2[1])
     def darkenRect(self,draw,start,end,amount=25):
-        for x in range(start[0],end[0]):
-            for y in range(start[1],end[1]):
-                color = self.background.getpixel((x,y))
-                r = integers.min(color[0]-amount,0)
-                g = integers.min(color[1]-amount,0)
-                b = integers.min(color[2]-amount,0)
-                a = color[3]
-                color = (r,g,b,a)
-                draw.point((x,y),fill=color)
+        darkenRect(self.background,start,end,amount)
     def out(self):
         return self.background
 
+class TileCache:
+    """Least recently used item tiles, persisted to directory when one is given"""
+    def __init__(self,size=TILE_CACHE_SIZE,directory=TILE_CACHE_DIR,max_age=TILE_CACHE_MAX_AGE):
+        self.size = size
+        self.directory = directory
+        self.max_age = max_age
+        self.tiles = OrderedDict()
+        self.pruned = 0
+        self._lock = threading.Lock()
+    def filename(self,key):
+        return os.path.join(self.directory,hashlib.sha1(repr(key).encode('utf-8')).hexdigest()+'.png')
+    def get(self,key):
+        with self._lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                return tile.copy()
+        if self.directory is None:
+            return None
+        filename = self.filename(key)
+        try:
+            tile = PIL.Image.open(filename)
+            tile.load()
+            os.utime(filename)
+        except IOError:
+            return None
+        self.remember(key,tile)
+        return tile.copy()
+    def put(self,key,tile):
+        self.remember(key,tile.copy())
+        if self.directory is not None:
+            os.makedirs(self.directory,exist_ok=True)
+            filename = self.filename(key)
+            tmp = '{0}.{1}.{2}.tmp'.format(filename,os.getpid(),threading.get_ident())
+            tile.save(tmp,'PNG')
+            os.replace(tmp,filename)
+            self.prune()
+    def remember(self,key,tile):
+        with self._lock:
+            self.tiles[key] = tile
+            self.tiles.move_to_end(key)
+            while len(self.tiles) > self.size:
+                self.tiles.popitem(last=False)
+    def prune(self):
+        """Removes tiles that haven't been used for max_age, at most once an hour"""
+        if self.pruned + 60*60 > now():
+            return
+        self.pruned = now()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png') and entry.stat().st_mtime + self.max_age < now():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+TILES = TileCache()
+
 class CountImage:
     def __init__(self, count):
         red = (255,0,0,255)
         white = (255,255,255,255)
         size = (50,50)
         count = str(count)
-        font = PIL.ImageFont.truetype(FONT, 36)
+        font = resources.font(FONT, 36)
         textsize = font.getsize(count)
         if textsize[0] > size[0]-10:
             size = (textsize[0]+10,size[1])
@@ -199,65 +259,109 @@ class CountImage:
         return self.background
 
 # functions
+def warm(size=512,fontsize=40):
+    """Loads the frames and fonts used for shop and upcoming images of this item size"""
+    fonts = [(FONT,fontsize),(FONT,36),(FONT,round(size/10)+10),(FONT,round(size/10)-10)]
+    resources.warm(fonts,FRAMES)
+
+def rarityGradient(rarity,size,gradient):
+    key = (rarity,size)
+    image = GRADIENTS.get(key)
+    if image is None:
+        image = images.radial_gradient_image((size,size),gradient[1],gradient[0])
+        GRADIENTS[key] = image
+    return image.copy()
+
+def darkenRect(image,start,end,amount=25):
+    """Darkens the rgb channels of an area of an rgba image by amount, alpha is left as is"""
+    box = (start[0],start[1],end[0],end[1])
+    area = image.crop(box)
+    lut = [integers.min(v-amount,0) for v in range(256)]
+    channels = area.split()
+    area = PIL.Image.merge('RGBA',[channel.point(lut) for channel in channels[:3]]+[channels[3]])
+    image.paste(area,box)
+
 def createImageFromContent(content):
     image = PIL.Image.open(BytesIO(content)).convert("RGBA")
     return image
 
 def createImageFromUrl(url):
-    resp = requests.get(url)
-    return createImageFromContent(resp.content)
+    return ASSETS.image_sync(url)
+
+@asyncio.coroutine
+def fetchImage(url):
+    image = yield from ASSETS.image(url)
+    return image
+
+@asyncio.coroutine
+def fetchImages(urls):
+    """Downloads all urls concurrently, returns a dict of url to image"""
+    urls = list(set(urls))
+    fetched = yield from asyncio.gather(*[fetchImage(url) for url in urls])
+    return dict(zip(urls,fetched))
+
+def validLink(link):
+    return link != '' and link != False and link != 'False' and link != 'false'
+
+def itemImageUrl(item):
+    for link in (item.featured,item.icon,item.png):
+        if validLink(link):
+            return link
+    return item.priceIconLink
+
+def countBadge(count):
+    if count > 0:
+        if count == 1:
+            return 'NEW'
+        return '{} DAYS'.format(count)
+    return None
+
+def itemSpecs(items,backupprice=PRICE_ICON):
+    """Returns (item, image url, price icon url, count) for each item, items without a price icon use the last one seen"""
+    specs = []
+    for item in items:
+        if validLink(item.priceIconLink):
+            backupprice = item.priceIconLink
+        if item.seen is not None:
+            count = item.seen.occurrences
+        else:
+            count = -1
+        specs.append((item,itemImageUrl(item),backupprice,count))
+    return specs
+
+def tileKey(spec,size):
+    item, url, price, count = spec
+    return (item.id,item.name,item.price,item.rarity,url,price,countBadge(count),size)
+
+@asyncio.coroutine
+def itemImages(specs,size=512):
+    """Item images for specs, only fetching and composing the ones that aren't in the tile cache"""
+    keys = [tileKey(spec,size) for spec in specs]
+    tiles = [TILES.get(key) for key in keys]
+    missing = [i for i, tile in enumerate(tiles) if tile is None]
+    logging.getLogger('shop-generator').debug('Tile cache hits: %d/%d',len(specs)-len(missing),len(specs))
+    if len(missing) > 0:
+        urls = [specs[i][1] for i in missing] + [specs[i][2] for i in missing]
+        preloaded = yield from fetchImages(urls)
+        for i in missing:
+            item, url, price, count = specs[i]
+            tiles[i] = ItemImage(item.name,item.price,price,item.rarity,url,size,count,preloaded).out()
+            TILES.put(keys[i],tiles[i])
+    return tiles
 
 # generate
 @asyncio.coroutine
 def generate_image(apikey):
     print("Generating image")
-    featured = []
-    daily = []
     shopdata = yield from getShopData(apikey)
     if shopdata is None:
         return None
     time = getTime(shopdata.data.date)
     date = time.strftime("%A %d %B")
-
-    backupprice = 'https://image.fnbr.co/price/icon_vbucks.png'
-    for item in shopdata.data.featured:
-        if item.priceIconLink != 'false' and item.priceIconLink != False and item.priceIconLink != 'False':
-            backupprice = item.priceIconLink
-            priceIcon = item.priceIconLink
-        else:
-            priceIcon = backupprice
-        if item.seen is not None:
-            count = item.seen.occurrences
-        else:
-            count = -1
-        if item.featured != '' and item.featured != False and item.featured != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.featured,512,count)
-        elif item.icon != '' and item.icon != False and item.icon != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.icon,512,count) # i need to create a function for this
-        elif item.png != '' and item.png != False and item.png != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.png,512,count)
-        else:
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.priceIconLink,512,count)
-        featured.append(im.out())
-    for item in shopdata.data.daily:
-        if item.priceIconLink != 'false' and item.priceIconLink != False and item.priceIconLink != 'False':
-            backupprice = item.priceIconLink
-            priceIcon = item.priceIconLink
-        else:
-            priceIcon = backupprice
-        if item.seen is not None:
-            count = item.seen.occurrences
-        else:
-            count = -1
-        if item.featured != '' and item.featured != False and item.featured != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.featured,512,count)
-        elif item.icon != '' and item.icon != False and item.icon != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.icon,512,count)
-        elif item.png != '' and item.png != False and item.png != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.png,512,count)
-        else:
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.priceIconLink,512,count)
-        daily.append(im.out())
+    specs = itemSpecs(shopdata.data.featured+shopdata.data.daily)
+    items = yield from itemImages(specs)
+    featured = items[:len(shopdata.data.featured)]
+    daily = items[len(shopdata.data.featured):]
     if len(shopdata.data.featured) > 4:
         size = 5
     else:
@@ -1,13 +1,13 @@
 from dataretrieval import stats
-from utils import integers, times, strings
+from utils import integers, times, strings, http
 import PIL.Image
 import PIL.ImageDraw
 import PIL.ImageFont
 import asyncio
-import aiohttp
 import random
 from io import BytesIO
 import logging
+from . import resources
 
 LOGGER = logging.getLogger('stats_generation')
 
@@ -51,11 +51,7 @@ class Background:
     @staticmethod
     @asyncio.coroutine
     def collectImage(url):
-        session = aiohttp.ClientSession()
-        response = yield from session.get(url)
-        content = yield from response.read()
-        response.close()
-        yield from session.close()
+        response, content = yield from http.read(url)
         image = PIL.Image.open(BytesIO(content)).convert('RGBA')
         return image
     @staticmethod
@@ -120,8 +116,8 @@ class Overview:
         image = PIL.Image.new('RGBA',self.size,self.color)
         draw = PIL.ImageDraw.Draw(image)
         fontsize = round(self.size[1]/2)-self.padding*2
-        font = PIL.ImageFont.truetype(DEFAULT_FONT,size=fontsize)
-        font_small = PIL.ImageFont.truetype(DEFAULT_FONT,size=round(fontsize/2))
+        font = resources.font(DEFAULT_FONT,fontsize)
+        font_small = resources.font(DEFAULT_FONT,round(fontsize/2))
         draw.text((self.padding,self.padding),userdata.name,fill=(255,255,255,255),font=font)
         statstext = 'KD {kd} | WINS {wins} | WIN% {win_percent}'.format_map(statsmap)
         draw.text((self.padding,fontsize+self.padding*3),statstext,fill=(255,255,255,255),font=font)
@@ -149,7 +145,7 @@ class Performance:
         image = PIL.Image.new('RGBA',self.size,self.color)
         draw = PIL.ImageDraw.Draw(image)
         fontsize = round(self.padding/3*2)
-        font = PIL.ImageFont.truetype(DEFAULT_FONT_NEAT,size=fontsize)
+        font = resources.font(DEFAULT_FONT_NEAT,fontsize)
         fg = (255,255,255,255)
         draw.line([(self.padding,self.padding),(self.padding,self.size[1]-self.padding)],fill=fg,width=2)
         draw.line([(self.padding,self.size[1]-self.padding),(self.size[0]-self.padding,self.size[1]-self.padding)],fill=fg,width=2)
@@ -247,7 +243,7 @@ class Main:
         stats = data.stats
         image = PIL.Image.new('RGBA',self.size,self.color)
         draw = PIL.ImageDraw.Draw(image)
-        font = PIL.ImageFont.truetype(DEFAULT_FONT_NEAT,size=24)
+        font = resources.font(DEFAULT_FONT_NEAT,24)
         fg = (255,255,255,255)
         columnsize = round(self.size[0]/7)
         rowsize = round(self.size[1]/4)
@@ -10,7 +10,8 @@ from os.path import isfile
 import logging
 
 from dataretrieval import fnbr
-from .shop import ItemImage
+from .shop import itemSpecs, itemImages
+from . import resources
 
 FONT = "assets/burbank.ttf"
 
@@ -19,7 +20,7 @@ class UpcomingImage:
         self.size = size
         self.padding = padding
         self.fontsize = fontsize
-        self.font = PIL.ImageFont.truetype(FONT,self.fontsize)
+        self.font = resources.font(FONT,self.fontsize)
         self.fheight = self.font.getsize("Tp")[1]
         self.rows = ceil(icount/rowsize)
         self.rowsize = rowsize
@@ -60,27 +61,7 @@ class UpcomingImage:
 @asyncio.coroutine
 def generate_image(apikey):
     data = yield from getData(apikey)
-    items = []
-    backupprice = 'https://image.fnbr.co/price/icon_vbucks.png'
-    for item in data.data.items:
-        if item.priceIconLink != 'false' and item.priceIconLink != False and item.priceIconLink != 'False':
-            backupprice = item.priceIconLink
-            priceIcon = item.priceIconLink
-        else:
-            priceIcon = backupprice
-        if item.seen is not None:
-            count = item.seen.occurrences
-        else:
-            count = -1
-        if item.featured != '' and item.featured != False and item.featured != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.featured,512,count)
-        elif item.icon != '' and item.icon != False and item.icon != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.icon,512,count) # i need to create a function for this
-        elif item.png != '' and item.png != False and item.png != 'False':
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.png,512,count)
-        else:
-            im = ItemImage(item.name,item.price,priceIcon,item.rarity,item.priceIconLink,512,count)
-        items.append(im.out())
+    items = yield from itemImages(itemSpecs(data.data.items))
     image_generator = UpcomingImage(size=300, padding=40, fontsize=40, rowsize=5, icount=len(items), background=None)
     image = yield from image_generator.generate(items)
     return image
@@ -198,7 +198,7 @@ def update_prefix(server,prefix,done,error):
         yield from error
     else:
         try:
-            UPDATE_SERVER(server,prefix=prefix)
+            yield from UPDATE_SERVER(server,prefix=prefix)
             yield from done
         except:
             error_text = traceback.format_exc()
@@ -271,7 +271,7 @@ def update_locale(server,locale,done,error):
         logger.error('Error updating locale: %s',error_text)
     else:
         try:
-            UPDATE_SERVER(server,locale=locale)
+            yield from UPDATE_SERVER(server,locale=locale)
             yield from done
             logger.debug('Updated locale to %s for %s',locale,server)
         except:
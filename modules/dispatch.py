@@ -0,0 +1,73 @@
+import asyncio
+from .module import Command, Map, get_prefix
+
+# distinct prefix/bot id combinations whose compiled aliases are kept
+ALIAS_CACHE_SIZE = 1024
+
+class Dispatcher:
+    """Index of every module's command names and aliases, finds the commands a message is for without scanning them all"""
+    def __init__(self,modules):
+        self.modules = []
+        for module in modules:
+            if module not in self.modules:
+                self.modules.append(module)
+        self.names = {}
+        for module in self.modules:
+            for position, cmd in enumerate(module.commands):
+                if isinstance(module.commands[cmd],Command):
+                    self.names.setdefault(cmd,[]).append((module,position,cmd))
+        self.lengths = sorted(set(len(name) for name in self.names))
+        self.compiled = {}
+    def commands(self,command):
+        """{module: [(cmd, None)]} for the command names command starts with, in each module's command order"""
+        found = []
+        for length in self.lengths:
+            if length > len(command):
+                break
+            found += [(module,position,cmd,None) for module, position, cmd in self.names.get(command[:length],[])]
+        return group(found)
+    def aliases(self,content,settings):
+        """{module: [(cmd, text after the alias)]} for the aliases content starts with, formatted with the modules' prefix for settings like Module._run_alias"""
+        index = self.alias_index(get_prefix(settings))
+        found = {}
+        for order, alias, module, position, cmd in sorted(index.get(content[:1],[]) + index.get('',[]),key=lambda entry: entry[0]):
+            if content.startswith(alias):
+                found[(module,cmd)] = (module,position,cmd,content[len(alias):])
+        return group(found.values())
+    def candidate(self,content,prefix,settings):
+        """Whether content starts with the server's command prefix or could be an alias, anything else is ordinary chat"""
+        return content.startswith(prefix) or len(self.aliases(content,settings)) > 0
+    def alias_index(self,prefix):
+        """Aliases formatted for prefix and the modules' bot ids, indexed by their first character"""
+        key = (prefix,tuple(module.client_id for module in self.modules))
+        index = self.compiled.get(key)
+        if index is None:
+            index = {}
+            order = 0
+            for module in self.modules:
+                values = Map({'prefix':prefix,'bot_id':module.client_id})
+                for position, cmd in enumerate(module.commands):
+                    if isinstance(module.commands[cmd],Command):
+                        for alias in module.commands[cmd].aliases:
+                            alias = alias.format_map(values).strip()
+                            index.setdefault(alias[:1],[]).append((order,alias,module,position,cmd))
+                            order += 1
+            if len(self.compiled) >= ALIAS_CACHE_SIZE:
+                self.compiled.clear()
+            self.compiled[key] = index
+        return index
+    @asyncio.coroutine
+    def run(self,client,output,modules,matches,msg,settings):
+        """Runs the matched commands of modules in order, passing the output along like Module._run"""
+        for module in modules:
+            for cmd, command in matches.get(module,[]):
+                if command is None:
+                    command = msg.content[len(get_prefix(settings)):]
+                output = yield from module._run_command(client,output,cmd,command,msg,settings)
+        return output
+
+def group(found):
+    matches = {}
+    for module, position, cmd, command in sorted(found,key=lambda match: match[1]):
+        matches.setdefault(module,[]).append((cmd,command))
+    return matches
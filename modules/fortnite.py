@@ -1,6 +1,6 @@
 from .module import Module, Command, parse_user_at
 from dataretrieval import aiofnotes, meta
-from imagegeneration import shop, stats, upcoming
+from imagegeneration import shop, render
 from utils import strings, arrays
 import localisation
 import traceback
@@ -9,7 +9,7 @@ import discord
 import asyncio
 import urllib
 import logging
-import transportDefs
+from io import BytesIO
 
 logger = logging.getLogger('bot.fortnite')
 
@@ -43,12 +43,12 @@ class Shop(Command):
         locale = settings.get('locale')
         logger = logging.getLogger('shop-command')
         bgs = settings.get('backgrounds',{}).get('shop',[])
-        request = transportDefs.ShopImage.Request(msg.id,apikey=self.fnbr_key,serverid=msg.server.id,backgrounds=bgs)
         try:
             logger.debug('Generating')
-            file = yield from client.threadRequest(request)
+            filename, image = yield from render.shop_image(self.fnbr_key,msg.server.id,bgs)
             self.typing = True
-            self.file = file
+            self.file = BytesIO(image)
+            self.filename = filename
             self.content = localisation.getMessage('shop_success',lang=locale)
         except Exception as e:
             self.content = localisation.getMessage('shop_error',lang=locale)
@@ -76,9 +76,10 @@ class Upcoming(Command):
             logger.debug('Generating')
             bgs = settings.get('backgrounds',{})
             bgs_s = bgs.get('upcoming',[])
-            file = yield from upcoming.generate(self.fnbr_key,msg.server.id,bgs_s)
+            filename, image = yield from render.upcoming_image(self.fnbr_key,msg.server.id,bgs_s)
             self.typing = True
-            self.file = file
+            self.file = BytesIO(image)
+            self.filename = filename
             self.content = localisation.getMessage('shop_success',lang=locale)
         except Exception as e:
             self.content = localisation.getMessage('shop_error',lang=locale)
@@ -112,9 +113,9 @@ class Stats(Command):
                 bgs = settings.get('backgrounds',{})
                 bgs_s = bgs.get('stat',[])
                 if type == 'regular':
-                    statsimage = yield from stats.generate(self.tn_key,name,platform,bgs_s)
+                    statsimage = yield from render.stats_image(self.tn_key,name,platform,bgs_s)
                 elif type == 'curr_season':
-                    statsimage = yield from stats.generate_season(self.tn_key,name,platform,bgs_s)
+                    statsimage = yield from render.stats_image(self.tn_key,name,platform,bgs_s,'season')
                 if statsimage is None:
                     if linked:
                         self.content = localisation.getFormattedMessage('stats_notfound_link',username=name,platform=platform,lang=locale)
@@ -124,9 +125,9 @@ class Stats(Command):
                             self.content += localisation.getMessage('stats_notfound_console',lang=locale)
                 else:
                     self.typing = True
-                    statsimage.save('generatedstats.png')
                     self.content = '<https://{}>'.format(urllib.parse.quote('fortnitetracker.com/profile/{1}/{0}'.format(name,platform)))
-                    self.file = 'generatedstats.png'
+                    self.file = BytesIO(statsimage[1])
+                    self.filename = statsimage[0]
             except Exception as e:
                 if linked:
                     self.content = localisation.getFormattedMessage('stats_error_link',username=name,platform=platform,lang=locale)
@@ -159,13 +160,13 @@ class Matches(Command):
             logger.debug('Stats command name: %s platform %s', name, platform)
             bgs = settings.get('backgrounds',{})
             bgs_s = bgs.get('stat',[])
-            statsimage = yield from stats.generate_performance(self.tn_key,name,platform,bgs_s)
+            statsimage = yield from render.stats_image(self.tn_key,name,platform,bgs_s,'performance')
             if statsimage == None:
                 self.content = '<@!{author}> User not found'
             else:
                 self.typing = True
-                statsimage.save('generatedmatches.png')
-                self.file = 'generatedmatches.png'
+                self.file = BytesIO(statsimage[1])
+                self.filename = statsimage[0]
         except Exception as e:
             self.content = "Error getting stats"
             logger.error(traceback.format_exc())
@@ -185,7 +186,7 @@ class Link(Command):
             if len(name.strip()) > 0:
                 self.content = localisation.getFormattedMessage('link_success',author=msg.author.id,username=name,platform=platform,lang=locale)
                 try:
-                    self.sql.set_link(msg.author.id,name,platform)
+                    yield from self.sql.set_link(msg.author.id,name,platform)
                 except:
                     traceback.print_exc()
                     self.content = localisation.getFormattedMessage('link_error',author=msg.author.id,lang=locale)
@@ -201,7 +202,7 @@ class UnLink(Command):
     def run(self,client,command,msg,settings):
         locale = settings.get('locale')
         try:
-            self.sql.delete_link(msg.author.id)
+            yield from self.sql.delete_link(msg.author.id)
             self.content = localisation.getFormattedMessage('unlink_success',author=msg.author.id,lang=locale)
         except:
             traceback.print_exc()
@@ -412,7 +413,7 @@ def parse_fortnite_user(args, author=None, server=None, sql=None):
         name = args
     if sql is not None:
         if len(name) < 1:
-            data = sql.get_link(author)
+            data = yield from sql.get_link(author)
             if data != None:
                 name = data['user_nickname']
                 platform = data['user_platform']
@@ -420,7 +421,7 @@ def parse_fortnite_user(args, author=None, server=None, sql=None):
         else:
             try:
                 user = parse_user_at(name,server)
-                data = sql.get_link(user.id)
+                data = yield from sql.get_link(user.id)
                 if data != None:
                     name = data['user_nickname']
                     platform = data['user_platform']
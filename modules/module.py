@@ -88,6 +88,7 @@ class Command:
     def reset(self):
         self.content = None
         self.file = None
+        self.filename = None
         self.embed = None
         self.embeds = None
         self.custom = None
@@ -120,6 +121,7 @@ class Command:
     def __iter__(self):
         yield 'content', self.content
         yield 'file', self.file
+        yield 'filename', self.filename
         yield 'embed', self.embed
         yield 'embeds', self.embeds
         yield 'settings', self.settings
@@ -1,17 +1,156 @@
+import multiprocessing
+import logging
 import os
-import threading
+import runpy
+import signal
+import time
 
-THREADS = 2
+# shards are split into groups of SHARDS_PER_PROCESS, each group runs in its own process
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 2))
+SHARDS_PER_PROCESS = int(os.environ.get('SHARDS_PER_PROCESS', 1))
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = int(os.environ.get('HEARTBEAT_TIMEOUT', 120))
+# seconds before restarting a crashed process, doubled after each crash up to the max
+RESTART_BACKOFF = 5
+RESTART_BACKOFF_MAX = 5*60
+# a process that has been up this long is considered stable again and its backoff is reset
+STABLE_TIME = 10*60
 
-class BotThread:
-    def __init__(self, shard_id, shard_count):
-        self.shard_id = shard_id
+def run_shards(shard_ids,shard_count,heartbeat):
+    """Entry point of a shard process, beats as long as every shard's loop keeps beating"""
+    import threads
+    from imagegeneration import shop, render
+    shop.warm()
+    render.start()
+    controller = threads.ThreadController(shard_ids=shard_ids,shard_count=shard_count)
+    signal.signal(signal.SIGTERM,lambda signum, frame: controller.stop())
+    controller.start()
+    while controller.is_alive():
+        if not controller.healthy():
+            logging.getLogger('shard-process').error('Shard thread died in %s, exiting',shard_ids)
+            controller.stop()
+            render.stop()
+            os._exit(1)
+        heartbeat.value = controller.heartbeat()
+        controller.join(HEARTBEAT_INTERVAL)
+    render.stop()
+
+def run_script(filename):
+    signal.signal(signal.SIGTERM,signal.SIG_DFL)
+    runpy.run_path(filename,run_name='__main__')
+
+class SupervisedProcess:
+    def __init__(self,name,target,args=(),heartbeat=False):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.heartbeat = multiprocessing.Value('d',0.0) if heartbeat else None
+        self.process = None
+        self.started = 0
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF
+        self.next_start = 0
+    def start(self):
+        args = self.args
+        if self.heartbeat is not None:
+            self.heartbeat.value = time.time()
+            args = args + (self.heartbeat,)
+        self.process = multiprocessing.Process(target=self.target,args=args,name=self.name)
+        self.process.start()
+        self.started = time.time()
+    @property
+    def alive(self):
+        if self.process is None or not self.process.is_alive():
+            return False
+        if self.heartbeat is not None and self.heartbeat.value + HEARTBEAT_TIMEOUT < time.time():
+            return False
+        return True
+    def stop(self,timeout=30):
+        """Terminates the process, killing it if it hasn't exited after timeout so it can't run beside its replacement"""
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+            if self.process.is_alive():
+                os.kill(self.process.pid,signal.SIGKILL)
+                self.process.join()
+    def health(self):
+        health = {'alive':self.alive,'restarts':self.restarts,'pid':None,'uptime':0}
+        if self.process is not None:
+            health['pid'] = self.process.pid
+            health['exitcode'] = self.process.exitcode
+        if self.alive:
+            health['uptime'] = round(time.time()-self.started)
+        if self.heartbeat is not None:
+            health['heartbeat'] = round(time.time()-self.heartbeat.value)
+        return health
+
+class Supervisor:
+    """Runs shard groups (and any extra scripts) as processes, restarting them with backoff when they die or stop beating"""
+    def __init__(self,shard_count=SHARD_COUNT,per_process=SHARDS_PER_PROCESS,scripts=()):
         self.shard_count = shard_count
+        self.processes = []
+        shard_ids = list(range(shard_count))
+        for i in range(0,shard_count,per_process):
+            group = shard_ids[i:i+per_process]
+            name = 'shards_{0}-{1}'.format(group[0],group[-1])
+            self.processes.append(SupervisedProcess(name,run_shards,(group,shard_count),heartbeat=True))
+        for script in scripts:
+            self.processes.append(SupervisedProcess(script,run_script,(script,)))
+        self.stoprequest = False
+        self.logger = logging.getLogger('supervisor')
+    def start(self):
+        for process in self.processes:
+            process.start()
+            self.logger.info('Started %s (pid %d)',process.name,process.process.pid)
+    def check(self):
+        """Restarts any process that died or stopped beating once its backoff has passed"""
+        now = time.time()
+        for process in self.processes:
+            if process.alive:
+                if process.started + STABLE_TIME < now:
+                    process.backoff = RESTART_BACKOFF
+                continue
+            if process.next_start == 0:
+                process.stop()
+                process.next_start = now + process.backoff
+                self.logger.error('%s is down (exit code %s), restarting in %ds',process.name,process.process.exitcode,process.backoff)
+                process.backoff = min(process.backoff*2,RESTART_BACKOFF_MAX)
+            elif process.next_start <= now:
+                process.next_start = 0
+                process.restarts += 1
+                process.start()
+                self.logger.info('Restarted %s (pid %d)',process.name,process.process.pid)
+    def health(self):
+        processes = {process.name: process.health() for process in self.processes}
+        alive = len([health for health in processes.values() if health['alive']])
+        return {'shards':self.shard_count,'processes':len(processes),'alive':alive,'restarts':sum(process.restarts for process in self.processes),'detail':processes}
     def run(self):
-        os.system('python bot.py {} {}'.format(self.shard_id,self.shard_count))
+        self.start()
+        signal.signal(signal.SIGTERM,lambda signum, frame: self.stop())
+        last_report = 0
+        while not self.stoprequest:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if self.stoprequest:
+                break
+            self.check()
+            if last_report + 5*60 < time.time():
+                last_report = time.time()
+                health = self.health()
+                self.logger.info('Health: %d/%d processes alive, %d restarts',health['alive'],health['processes'],health['restarts'])
+    def stop(self):
+        self.stoprequest = True
+        for process in self.processes:
+            process.stop()
+
+
+def main(scripts=()):
+    """Applies database migrations once and then supervises the shard processes and scripts"""
+    logging.basicConfig(level=logging.INFO)
+    from datamanagement import sql
+    sql.Database(True, url=os.environ.get('DATABASE_URL'))
+    supervisor = Supervisor(scripts=scripts)
+    supervisor.run()
 
 
 if __name__ == '__main__':
-    for i in range(THREADS):
-        thread = BotThread(i,THREADS)
-        threading.Thread(target=thread.run).start()
+    main()
@@ -1,14 +1,4 @@
-import threading
-import os
+import shards
 
-class MyThread:
-    def __init__(self, filename):
-        self.name = filename
-    def run(self):
-        os.system('python {}'.format(self.name))
-
-threads = ['bot.py','autoupdates.py']
-
-for filename in threads:
-    thread = MyThread(filename)
-    threading.Thread(target=thread.run).start()
+if __name__ == '__main__':
+    shards.main()
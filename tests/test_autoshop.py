@@ -0,0 +1,61 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+for key in ('KEY_DISCORD','KEY_FNBR','KEY_TRACKERNETWORK','DATABASE_URL'):
+    os.environ.setdefault(key,'test')
+import bot
+
+class Client:
+    def __init__(self,database):
+        self.database = database
+        self.is_closed = False
+        self.sent = []
+    @asyncio.coroutine
+    def wait_until_ready(self):
+        pass
+    @asyncio.coroutine
+    def send_file(self,destination,fp,filename=None,content=None):
+        self.sent.append(filename)
+
+class AutoshopTest(unittest.TestCase):
+    def setUp(self):
+        self.database = mock.Mock()
+        self.database.set_server_info = mock.Mock(side_effect=asyncio.coroutine(lambda *args, **kwargs: None))
+        self.client = Client(self.database)
+        self.sleeps = []
+    def run_once(self,targets,variants,now=1000,tommorow=1000+60*60*24):
+        @asyncio.coroutine
+        def sleep(delay):
+            if delay != bot.RATE_LIMIT_TIME:
+                self.sleeps.append(delay)
+                self.client.is_closed = True
+        @asyncio.coroutine
+        def broadcast_targets(client,channel_type):
+            return targets
+        @asyncio.coroutine
+        def shop_variants(key,due):
+            return variants
+        with mock.patch('bot.broadcast_targets',broadcast_targets), mock.patch('bot.render.shop_variants',shop_variants), \
+                mock.patch('bot.asyncio.sleep',sleep), mock.patch('bot.time.time',return_value=now), \
+                mock.patch('bot.tommorow',return_value=tommorow), mock.patch('bot.localisation.getMessage',return_value=''):
+            asyncio.get_event_loop().run_until_complete(bot.autoshop(self.client))
+    def test_failed_target_retries_before_a_later_success(self):
+        targets = [
+            ('1',{'next_shop':0,'channels':{'autoshop':'10'}}),
+            ('2',{'next_shop':0,'channels':{'autoshop':'20'}})
+        ]
+        self.run_once(targets,{'1':RuntimeError('render failed'),'2':('shop.png',b'')})
+        self.assertEqual(self.client.sent,['shop.png'])
+        self.database.set_server_info.assert_any_call('1',next_shop=1000+bot.SHOP_RETRY_TIME)
+        self.assertEqual(self.sleeps,[bot.SHOP_RETRY_TIME+10])
+    def test_sleeps_until_the_earliest_server_not_yet_due(self):
+        targets = [
+            ('1',{'next_shop':1000+300,'channels':{'autoshop':'10'}}),
+            ('2',{'next_shop':1000+600,'channels':{'autoshop':'20'}})
+        ]
+        self.run_once(targets,{})
+        self.assertEqual(self.sleeps,[300+10])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from datamanagement.cache import TimedCache
+
+class TimedCacheTest(unittest.TestCase):
+    def test_put_and_get(self):
+        cache = TimedCache(60)
+        cache.put('server',{'prefix':'!'})
+        self.assertEqual(cache.get('server'),{'prefix':'!'})
+    def test_load_racing_a_write_is_not_cached(self):
+        cache = TimedCache(60)
+        since = cache.version()
+        cache.update('server',lambda info: info.update({'prefix':'?'}))
+        self.assertFalse(cache.put('server',{'prefix':'!'},since))
+        self.assertIsNone(cache.get('server'))
+    def test_load_racing_an_invalidate_is_not_cached(self):
+        cache = TimedCache(60)
+        since = cache.version()
+        cache.invalidate('server')
+        self.assertFalse(cache.put('server',{'prefix':'!'},since))
+    def test_load_after_a_write_is_cached(self):
+        cache = TimedCache(60)
+        cache.invalidate('server')
+        since = cache.version()
+        self.assertTrue(cache.put('server',{'prefix':'!'},since))
+        self.assertEqual(cache.peek('server',lambda info: info['prefix']),'!')
+    def test_expired_entries_are_purged(self):
+        cache = TimedCache(0)
+        cache.put('old',1)
+        cache._purged -= 1
+        cache.put('new',2)
+        self.assertNotIn('old',cache._data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from modules.module import Module, Command, DEFAULT_PREFIX
+from modules.dispatch import Dispatcher
+
+def module(name,commands,client_id=''):
+    result = Module(name=name,client_id=client_id)
+    result.commands = commands
+    return result
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.fortnite = module('fortnite',{
+            'shop': Command(name='shop'),
+            'stats': Command(name='stats',aliases=['{prefix}']),
+            'status': Command(name='status')
+        })
+        self.default = module('default',{
+            'help': Command(name='help',aliases=['<@{bot_id}>','<@!{bot_id}>']),
+            'setprefix': Command(name='setprefix')
+        },client_id='1234')
+        self.dispatcher = Dispatcher([self.fortnite,self.default])
+    def test_commands_match_on_startswith(self):
+        self.assertEqual(self.dispatcher.commands('shopnow'),{self.fortnite:[('shop',None)]})
+        self.assertEqual(self.dispatcher.commands('status'),{self.fortnite:[('status',None)]})
+        self.assertEqual(self.dispatcher.commands('hello'),{})
+    def test_aliases_use_the_module_prefix_by_default(self):
+        for settings in ({},{'prefix':None}):
+            self.assertEqual(self.dispatcher.aliases(DEFAULT_PREFIX+'ninja',settings),{self.fortnite:[('stats','ninja')]})
+        self.assertEqual(self.dispatcher.aliases('ninja',{}),{})
+    def test_aliases_use_the_server_prefix(self):
+        self.assertEqual(self.dispatcher.aliases('?ninja',{'prefix':'?'}),{self.fortnite:[('stats','ninja')]})
+        self.assertEqual(self.dispatcher.aliases(DEFAULT_PREFIX+'ninja',{'prefix':'?'}),{})
+    def test_mention_aliases(self):
+        self.assertEqual(self.dispatcher.aliases('<@!1234> hi',{}),{self.default:[('help',' hi')]})
+        self.assertEqual(self.dispatcher.aliases('<@!99> hi',{}),{})
+    def test_candidate(self):
+        self.assertTrue(self.dispatcher.candidate('?shop','?',{'prefix':'?'}))
+        self.assertTrue(self.dispatcher.candidate('<@1234>','?',{'prefix':'?'}))
+        self.assertFalse(self.dispatcher.candidate('just chatting','?',{'prefix':'?'}))
+
+if __name__ == '__main__':
+    unittest.main()
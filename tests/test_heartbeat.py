@@ -0,0 +1,45 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+for key in ('KEY_DISCORD','KEY_FNBR','KEY_TRACKERNETWORK','DATABASE_URL'):
+    os.environ.setdefault(key,'test')
+import bot
+import threads
+
+class Client:
+    def __init__(self,connected):
+        self.is_closed = False
+        self.is_logged_in = True
+        self.ws = mock.Mock(open=connected)
+        self.beats = 0
+    def beat(self):
+        self.beats += 1
+
+def beat_once(client):
+    @asyncio.coroutine
+    def sleep(delay):
+        client.is_closed = True
+    with mock.patch('bot.asyncio.sleep',sleep):
+        asyncio.get_event_loop().run_until_complete(bot.heartbeat(client))
+
+class HeartbeatTest(unittest.TestCase):
+    def test_beats_while_connected(self):
+        client = Client(True)
+        beat_once(client)
+        self.assertEqual(client.beats,1)
+    def test_no_beat_while_the_gateway_is_disconnected(self):
+        client = Client(False)
+        beat_once(client)
+        self.assertEqual(client.beats,0)
+    def test_process_heartbeat_is_the_stalest_shard(self):
+        controller = threads.ThreadController(shard_ids=[0,1],shard_count=2)
+        controller.createShards()
+        controller.threads['shard_0'].last_beat = 100
+        controller.threads['shard_1'].last_beat = 50
+        self.assertEqual(controller.heartbeat(),50)
+        controller.threads['shard_1'].beat()
+        self.assertEqual(controller.heartbeat(),100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import PIL.Image
+import PIL.ImageDraw
+from utils import images
+
+GRADIENT = ((96,170,58,255),(23,81,23,255))
+
+class RadialGradientTest(unittest.TestCase):
+    def difference(self,size):
+        old = PIL.Image.new('RGBA',size)
+        images.radial_gradient(PIL.ImageDraw.Draw(old),size[0],size[1],GRADIENT[0],GRADIENT[1])
+        new = images.radial_gradient_image(size,GRADIENT[0],GRADIENT[1])
+        self.assertEqual(new.size,size)
+        return max(abs(a-b) for a, b in zip(old.tobytes(),new.tobytes()))
+    def test_square_sizes_match_the_per_pixel_gradient(self):
+        for size in ((64,64),(128,128),(7,7)):
+            self.assertLessEqual(self.difference(size),1,size)
+    def test_non_square_sizes_match_the_per_pixel_gradient(self):
+        for size in ((100,60),(60,100),(7,3)):
+            self.assertLessEqual(self.difference(size),1,size)
+    def test_rgb_colors(self):
+        image = images.radial_gradient_image((16,16),(255,0,0),(0,0,255))
+        self.assertEqual(image.mode,'RGB')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+from datamanagement import sql
+
+class MigrationsTest(unittest.TestCase):
+    def statements(self):
+        statements = []
+        for migration in sql.MIGRATIONS:
+            statements += migration.statements()
+        return statements
+    def test_versions_are_unique_and_ordered(self):
+        versions = [migration.version for migration in sql.MIGRATIONS]
+        self.assertEqual(versions,sorted(set(versions)))
+    def test_migrations_are_frozen(self):
+        for migration in sql.MIGRATIONS:
+            self.assertFalse(callable(migration._statements),'migration {} reads live definitions'.format(migration.version))
+    def test_migrations_create_every_table_and_index(self):
+        statements = self.statements()
+        for table in sql.TABLES:
+            self.assertIn(table().create(),statements)
+            for index in table().create_indexes():
+                self.assertIn(index,statements)
+
+if __name__ == '__main__':
+    unittest.main()
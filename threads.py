@@ -1,139 +1,66 @@
-import threading, queue, asyncio
-from imagegeneration import shop, stats, upcoming
+import threading, asyncio, time
+from imagegeneration import shop, render
 import bot
-import transportDefs
+from datamanagement import sql
 
-class Queue(queue.Queue):
-    def find(self, test):
-        """ Provide a test function to check all items in queue """
-        i = 0
-        for item in self.queue:
-            if test(item):
-                i += 1
-        return i
-    def getId(self,requestId):
-        for item in self.queue:
-            if isinstance(item,transportDefs.ThreadRequest):
-                if item.requestId == requestId:
-                    self.queue.remove(item)
-                    return item
-        return None
-
-class WorkerThread(threading.Thread):
-    def __init__(self):
-        super().__init__()
-        self.input = Queue()
-        self.output = Queue()
-        self.stoprequest = threading.Event()
-
-class ShopImage(WorkerThread):
-    def run(self):
-        loop = asyncio.new_event_loop()
-        while not self.stoprequest.isSet():
-            try:
-                request = self.input.get(True, 0.05)
-                if isinstance(request,transportDefs.ShopImage.Request):
-                    image = loop.run_until_complete(shop.generate(request.apikey,request.serverid,request.backgrounds))
-                    self.output.put(transportDefs.ShopImage.Response(request.source,request.requestId,image=image))
-            except queue.Empty:
-                continue
-
-class StatsImage(WorkerThread):
-    def run(self):
-        loop = asyncio.new_event_loop()
-        while not self.stoprequest.isSet():
-            try:
-                request = self.input.get(True, 0.05)
-                if isinstance(request,transportDefs.StatsImage.Request):
-                    if request.currentSeason:
-                        image = loop.run_until_complete(stats.generate_season(request.apikey,request.playername,request.platform,request.backgrounds))
-                    else:
-                        image = loop.run_until_complete(stats.generate(request.apikey,request.playername,request.platform,request.backgrounds))
-                    self.output.put(transportDefs.StatsImage.Response(request.source,request.requestId,image=image))
-            except queue.Empty:
-                continue
-
-class UpcomingImage(WorkerThread):
-    def run(self):
-        loop = asyncio.new_event_loop()
-        while not self.stoprequest.isSet():
-            try:
-                request = self.input.get(True, 0.05)
-                if isinstance(request,transportDefs.UpcomingImage.Request):
-                    image = loop.run_until_complete(upcoming.generate(request.apikey,request.serverid,request.backgrounds))
-                    self.output.put(transportDefs.UpcomingImage.Response(request,source,request.requestId,image=image))
-            except queue.Empty:
-                continue
-
-class Shard(WorkerThread):
+class Shard(threading.Thread):
     def __init__(self,*,id=0,count=1,name=''):
         super().__init__()
         self.id = id
         self.count = count
         self.name = name
+        self.shard = None
+        self.stoprequest = threading.Event()
+        self.last_beat = time.time()
     def run(self):
-        self.shard = bot.Shard(id=self.id,count=self.count,input=self.input,output=self.output)
-        self.shard.loop.create_task(self.kill())
+        self.shard = bot.Shard(id=self.id,count=self.count,beat=self.beat)
         self.shard.run()
-    @asyncio.coroutine
-    def kill(self):
-        while not self.stoprequest.isSet():
-            yield from asyncio.sleep(0.1)
-        print('Logging out of client')
-        yield from self.shard.logout()
+    def beat(self):
+        """Called from the shard's own loop"""
+        self.last_beat = time.time()
+    def stop(self):
+        self.stoprequest.set()
+        if self.shard is not None:
+            print('Logging out of client')
+            asyncio.run_coroutine_threadsafe(self.shard.logout(),self.shard.loop)
 
 class ThreadController(threading.Thread):
-    class Request:
-        def __init__(self,*,id=0):
-            self.id = id
-    def __init__(self,threads=1):
+    def __init__(self,threads=1,*,shard_ids=None,shard_count=None):
         super().__init__()
         self.threads = {}
         self.threadCount = threads
+        self.shardIds = list(range(threads)) if shard_ids is None else list(shard_ids)
+        self.shardCount = len(self.shardIds) if shard_count is None else shard_count
         self.stoprequest = threading.Event()
-        self.reqNo = 0
     def run(self):
         self.createShards()
-        # self.createWorkers()
         for threadName in self.threads:
             thread = self.threads[threadName]
             thread.start()
-        while not self.stoprequest.isSet():
-            for threadName in self.threads:
-                thread = self.threads[threadName]
-                if isinstance(thread,WorkerThread):
-                    try:
-                        request = thread.output.get(False)
-                    except queue.Empty:
-                        request = None
-                    if request is not None:
-                        if request.dest in self.threads:
-                            request.source = threadName
-                            self.threads[request.dest].input.put(request)
+        self.stoprequest.wait()
 
     def stop(self):
         self.stoprequest.set()
         for threadName in self.threads:
-            self.threads[threadName].stoprequest.set()
+            self.threads[threadName].stop()
+
+    def healthy(self):
+        """False once any started thread has died"""
+        return all(thread.is_alive() for thread in self.threads.values() if thread.ident is not None)
+
+    def heartbeat(self):
+        """Last beat of the shard that has gone longest without one"""
+        return min([thread.last_beat for thread in list(self.threads.values())] or [time.time()])
 
     def createShards(self):
-        for i in range(self.threadCount):
+        for i in self.shardIds:
             name = 'shard_{0}'.format(i)
-            self.threads[name] = Shard(id=i,count=self.threadCount,name=name)
-    def createWorkers(self):
-        threadMap = {
-            'shop': ShopImage(),
-            'stats': StatsImage(),
-            'upcoming': UpcomingImage()
-        }
-        for name in threadMap:
-            self.threads[name] = threadMap[name]
-        del threadMap
-
+            self.threads[name] = Shard(id=i,count=self.shardCount,name=name)
 
-def isRequest(value):
-    return isinstance(value,ThreadController.Request)
 
 if __name__ == '__main__':
+    sql.Database(True, url=bot.DATABASE_URL)
+    shop.warm()
+    render.start()
     controller = ThreadController(threads=2)
     controller.start()
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import aiohttp
+import requests
+from collections import OrderedDict
+from io import BytesIO
+from time import time as now
+import PIL.Image
+from . import http
+
+# disk location, total bytes kept on disk, seconds before an entry is revalidated and decoded images kept in memory
+CACHE_DIR = os.environ.get('ASSET_CACHE_DIR', 'cache/assets')
+CACHE_SIZE = int(os.environ.get('ASSET_CACHE_SIZE', 256*1024*1024))
+CACHE_MAX_AGE = int(os.environ.get('ASSET_CACHE_MAX_AGE', 6*60*60))
+CACHE_MEMORY = int(os.environ.get('ASSET_CACHE_MEMORY', 128))
+REQUEST_TIMEOUT = 30
+
+class AssetCache:
+    """Disk cache for remote images keyed by url hash, revalidated after max_age and evicted least recently used first, with decoded images kept in memory"""
+    def __init__(self,directory=CACHE_DIR,max_size=CACHE_SIZE,max_age=CACHE_MAX_AGE,memory_items=CACHE_MEMORY):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # bytes on disk as of the last eviction scan plus what this process stored since, None until the first scan
+        self.size = None
+        self._lock = threading.Lock()
+    def key(self,url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+    def paths(self,url):
+        key = self.key(url)
+        return os.path.join(self.directory,key), os.path.join(self.directory,key+'.json')
+    def load(self,url):
+        """Returns (content, meta) from disk, (None, None) if the url isn't cached"""
+        data_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(data_path,'rb') as f:
+                content = f.read()
+            os.utime(data_path)
+        except (IOError, ValueError):
+            return None, None
+        return content, meta
+    def fresh(self,meta):
+        return meta is not None and meta.get('checked',0) + self.max_age > now()
+    def validators(self,meta):
+        """Conditional request headers for a cached entry"""
+        headers = {'Accept':'image/*'}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+    def write(self,path,data,mode='wb'):
+        tmp = '{0}.{1}.{2}.tmp'.format(path,os.getpid(),threading.get_ident())
+        with open(tmp,mode) as f:
+            f.write(data)
+        os.replace(tmp,path)
+    def store(self,url,content,headers):
+        os.makedirs(self.directory,exist_ok=True)
+        data_path, meta_path = self.paths(url)
+        meta = {'url':url,'etag':headers.get('ETag'),'last_modified':headers.get('Last-Modified'),'checked':now()}
+        self.write(data_path,content)
+        self.write(meta_path,json.dumps(meta),'w')
+        with self._lock:
+            if self.size is not None:
+                self.size += len(content)
+            over = self.size is None or self.size > self.max_size
+        if over:
+            self.evict()
+    def touch(self,url,meta):
+        meta['checked'] = now()
+        self.write(self.paths(url)[1],json.dumps(meta),'w')
+    def evict(self):
+        """Removes the least recently used files until the cache fits in max_size"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.json') and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+                total += stat.st_size
+        if total <= self.max_size:
+            with self._lock:
+                self.size = total
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            for remove in (path,path+'.json'):
+                try:
+                    os.remove(remove)
+                except OSError:
+                    pass
+            total -= size
+        with self._lock:
+            self.size = total
+        logging.getLogger('asset-cache').debug('Evicted cache down to %d bytes',total)
+    def resolve(self,url,content,meta,status,headers,body):
+        """Works out the content for url from a (conditional) response, falling back to a stale copy on errors"""
+        if status == 304 and content is not None:
+            self.touch(url,meta)
+            return content
+        if status == 200:
+            self.store(url,body,headers)
+            return body
+        if content is not None:
+            logging.getLogger('asset-cache').warning('Serving stale %s after status %d',url,status)
+            return content
+        raise IOError('Unable to fetch {0}: status {1}'.format(url,status))
+    def unreachable(self,url,content,error):
+        """Stale copy of url when the request itself failed, re-raises if there isn't one"""
+        if content is None:
+            raise error
+        logging.getLogger('asset-cache').warning('Serving stale %s after %s',url,repr(error))
+        return content
+    def fetch_sync(self,url):
+        """Returns the bytes for url, blocking on the network when they need (re)validating"""
+        content, meta = self.load(url)
+        if self.fresh(meta):
+            return content
+        try:
+            response = requests.get(url,headers=self.validators(meta),timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            return self.unreachable(url,content,e)
+        return self.resolve(url,content,meta,response.status_code,response.headers,response.content)
+    @asyncio.coroutine
+    def fetch(self,url):
+        """Returns the bytes for url, using the shared aiohttp session when they need (re)validating"""
+        content, meta = self.load(url)
+        if self.fresh(meta):
+            return content
+        try:
+            response, body = yield from asyncio.wait_for(http.read(url,headers=self.validators(meta)),REQUEST_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return self.unreachable(url,content,e)
+        return self.resolve(url,content,meta,response.status,response.headers,body)
+    def remembered(self,url):
+        with self._lock:
+            entry = self.memory.get(url)
+            if entry is not None and entry[0] + self.max_age > now():
+                self.memory.move_to_end(url)
+                self.hits += 1
+                return entry[1].copy()
+            self.misses += 1
+            return None
+    def remember(self,url,content):
+        image = PIL.Image.open(BytesIO(content)).convert('RGBA')
+        with self._lock:
+            self.memory[url] = (now(),image)
+            self.memory.move_to_end(url)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+        return image.copy()
+    def image_sync(self,url):
+        """Decoded RGBA image for url, the caller gets its own copy"""
+        image = self.remembered(url)
+        if image is None:
+            image = self.remember(url,self.fetch_sync(url))
+        return image
+    @asyncio.coroutine
+    def image(self,url):
+        """Decoded RGBA image for url, the caller gets its own copy"""
+        image = self.remembered(url)
+        if image is None:
+            content = yield from self.fetch(url)
+            image = self.remember(url,content)
+        return image
+    @property
+    def stats(self):
+        with self._lock:
+            return {'hits':self.hits,'misses':self.misses,'memory':len(self.memory)}
+
+ASSETS = AssetCache()
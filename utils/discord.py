@@ -36,7 +36,7 @@ def get_server_priority(servers,get_priority):
     priority = 0
     done = False
     while priority < PRIORITY_LIMIT and done == False:
-        servers_p = get_priority(priority)
+        servers_p = yield from get_priority(priority)
         if len(servers_p) > 0:
             servers_r = []
             for server in servers_p:
@@ -55,3 +55,18 @@ def get_server_priority(servers,get_priority):
             servers_r.append(Object(server.id))
     servers_parsed.append(servers_r)
     return servers_parsed
+
+@asyncio.coroutine
+def get_broadcast_targets(servers,channel_type,get_subscribers,get_priority):
+    """Returns [(server_id, settings)] in priority order for every server in servers subscribed to channel_type"""
+    subscribers = yield from get_subscribers(channel_type)
+    servers_parsed = yield from get_server_priority(servers,get_priority)
+    targets = []
+    used = set()
+    for servers_r in servers_parsed:
+        for server in servers_r:
+            settings = subscribers.get(server.id)
+            if settings is not None and not server.id in used:
+                used.add(server.id)
+                targets.append((server.id,settings))
+    return targets
@@ -0,0 +1,60 @@
+import asyncio
+import aiohttp
+import os
+import threading
+import weakref
+
+# connection limit per host, keep alive and dns caching for the shared sessions
+LIMIT = int(os.environ.get('HTTP_LIMIT', 20))
+KEEPALIVE_TIMEOUT = int(os.environ.get('HTTP_KEEPALIVE_TIMEOUT', 60))
+DNS_CACHE = os.environ.get('HTTP_DNS_CACHE', 'true').lower() == 'true'
+
+SESSIONS = weakref.WeakKeyDictionary()
+LOCK = threading.Lock()
+
+def configure(limit=None,keepalive_timeout=None,dns_cache=None):
+    """Change pool settings, only applies to sessions created after the call"""
+    global LIMIT, KEEPALIVE_TIMEOUT, DNS_CACHE
+    if limit is not None:
+        LIMIT = limit
+    if keepalive_timeout is not None:
+        KEEPALIVE_TIMEOUT = keepalive_timeout
+    if dns_cache is not None:
+        DNS_CACHE = dns_cache
+
+def get_session(loop=None):
+    """Returns the shared ClientSession for loop (sessions can't be used across event loops so each shard thread gets its own)"""
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    with LOCK:
+        session = SESSIONS.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=LIMIT,keepalive_timeout=KEEPALIVE_TIMEOUT,use_dns_cache=DNS_CACHE,loop=loop)
+            session = aiohttp.ClientSession(connector=connector,loop=loop)
+            SESSIONS[loop] = session
+    return session
+
+@asyncio.coroutine
+def get(url,**kwargs):
+    """GET using the shared session, the caller must read or release the response"""
+    session = get_session()
+    response = yield from session.get(url,**kwargs)
+    return response
+
+@asyncio.coroutine
+def read(url,**kwargs):
+    response = yield from get(url,**kwargs)
+    try:
+        content = yield from response.read()
+    finally:
+        yield from response.release()
+    return response, content
+
+@asyncio.coroutine
+def close(loop=None):
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    with LOCK:
+        session = SESSIONS.pop(loop,None)
+    if session is not None and not session.closed:
+        yield from session.close()
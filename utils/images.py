@@ -1,16 +1,27 @@
 import math
+import os
 import asyncio
-import aiohttp
-from io import BytesIO
 import PIL.Image
+from PIL import ImageMath
 from os.path import isfile
 from .times import morning
-from random import choice
+from .assetcache import ASSETS
+from .singleflight import SingleFlight
+import random
+import hashlib
+import threading
 import traceback
 import logging
 
+# ImageMath.eval was renamed unsafe_eval in newer Pillow releases
+MATH_EVAL = getattr(ImageMath,'unsafe_eval',None) or ImageMath.eval
+
+# overlay and background composite generations in flight, keyed by filename
+OVERLAYS = SingleFlight()
+COMPOSITES = SingleFlight()
+
 def radial_gradient(draw,width,height,color_inner,color_outer): # will overite everything in image
-    """Creates a radial gradient on an image. Might be slow"""
+    """Creates a radial gradient on an image. Slow, radial_gradient_image is much faster"""
     alpha = False
     if len(color_inner) == 4 and len(color_outer) == 4:
         alpha = True
@@ -27,6 +38,21 @@ def radial_gradient(draw,width,height,color_inner,color_outer): # will overite e
             else:
                 color = (r,g,b)
             draw.point((x,y),fill=color)
+def radial_gradient_image(size,color_inner,color_outer):
+    """Same gradient as radial_gradient (within 1 per channel) for any size, built with ImageMath on float images"""
+    width, height = size
+    # squared distances to the centre along each axis, spread over the image so ImageMath can combine them
+    row = PIL.Image.new('F',(width,1))
+    row.putdata([(x-width/2) ** 2 for x in range(width)])
+    column = PIL.Image.new('F',(1,height))
+    column.putdata([(y-height/2) ** 2 for y in range(height)])
+    distance = MATH_EVAL('(x+y)**0.5/scale',x=row.resize(size,PIL.Image.NEAREST),y=column.resize(size,PIL.Image.NEAREST),scale=math.sqrt(2)*width/2)
+    channels = []
+    for inner, outer in zip(color_inner,color_outer):
+        channels.append(MATH_EVAL('convert(inner*d+outer*(1-d)+0.5,"L")',d=distance,inner=inner,outer=outer))
+    if len(channels) == 4:
+        return PIL.Image.merge('RGBA',channels)
+    return PIL.Image.merge('RGB',channels[:3])
 def darken(color,alpha):
     """Darkens a color to specified alpha"""
     return (color[0],color[1],color[2],alpha)
@@ -70,12 +96,7 @@ class Background:
     @staticmethod
     @asyncio.coroutine
     def collectImage(url):
-        session = aiohttp.ClientSession()
-        response = yield from session.get(url,headers={'Accept':'image/*'})
-        content = yield from response.read()
-        response.close()
-        yield from session.close()
-        image = PIL.Image.open(BytesIO(content)).convert('RGBA')
+        image = yield from ASSETS.image(url)
         return image
     @staticmethod
     @asyncio.coroutine
@@ -103,34 +124,70 @@ class Background:
             image = image.crop((0,top,image.width,bottom))
         return image
 
+def save_atomic(image,filename):
+    """Saves through a temporary file so other processes never open a half written image"""
+    tmp = '{0}.{1}.{2}.tmp'.format(filename,os.getpid(),threading.get_ident())
+    image.save(tmp,'PNG')
+    os.replace(tmp,filename)
+
+def overlay_filename(basename):
+    return '{0}-{1}.png'.format(basename,round(morning()))
+
 @asyncio.coroutine
-def daily_cache_generator(generator,serverid,backgrounds,basename,*genargs): # improve efficiency
-    logger = logging.getLogger('cache-gen')
-    filename_overlay = '{0}-{1}.png'.format(basename,round(morning()))
+def daily_overlay(generator,basename,*genargs):
+    """Today's overlay for basename, generated once however many callers ask for it at the same time"""
+    filename_overlay = overlay_filename(basename)
     if isfile(filename_overlay):
         overlay = PIL.Image.open(filename_overlay)
-        logger.debug('Used overlay from cache')
-    else:
-        overlay = None
-        count = 0
-        while overlay is None:
-            count += 1
-            if count > 1:
-                yield from asyncio.sleep(0.05)
-                if count > 9:
-                    raise RuntimeError('Unable to generate image')
-            overlay = yield from generator(*genargs)
-        overlay.save(filename_overlay)
-        logger.debug('Generated a new overlay')
-    if len(backgrounds) > 0:
-        filename_server = '{0}-{1}.png'.format(filename_overlay[:-4],serverid)
-        if not isfile(filename_server):
-            background = choice(backgrounds)
-            background_generator = Background((overlay.width,overlay.height),url=background)
-            output = yield from background_generator.generate()
-            output.paste(overlay,(0,0),overlay)
-            output.save(filename_server)
-        image = filename_server
-    else:
-        image = filename_overlay
+        logging.getLogger('cache-gen').debug('Used overlay from cache')
+        return filename_overlay, overlay
+    overlay = yield from OVERLAYS.do(filename_overlay,generate_overlay,filename_overlay,generator,*genargs)
+    return filename_overlay, overlay
+
+@asyncio.coroutine
+def generate_overlay(filename_overlay,generator,*genargs):
+    overlay = None
+    count = 0
+    while overlay is None:
+        count += 1
+        if count > 1:
+            yield from asyncio.sleep(0.05)
+            if count > 9:
+                raise RuntimeError('Unable to generate image')
+        overlay = yield from generator(*genargs)
+    save_atomic(overlay,filename_overlay)
+    logging.getLogger('cache-gen').debug('Generated a new overlay')
+    return overlay
+
+def pick_background(backgrounds,serverid):
+    """Background for serverid today, a server keeps the same one until the next morning"""
+    if len(backgrounds) == 0:
+        return None
+    return random.Random('{0}-{1}'.format(serverid,round(morning()))).choice(backgrounds)
+
+def variant_filename(filename_overlay,url):
+    return '{0}-{1}.png'.format(filename_overlay[:-4],hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+
+@asyncio.coroutine
+def composite(filename_variant,overlay,url):
+    background_generator = Background((overlay.width,overlay.height),url=url)
+    output = yield from background_generator.generate()
+    output.paste(overlay,(0,0),overlay)
+    save_atomic(output,filename_variant)
+    return filename_variant
+
+@asyncio.coroutine
+def daily_variant(generator,basename,url,*genargs):
+    """Filename of today's overlay on the background at url, every server using that background shares the file"""
+    filename_overlay, overlay = yield from daily_overlay(generator,basename,*genargs)
+    if url is None:
+        return filename_overlay
+    filename_variant = variant_filename(filename_overlay,url)
+    if not isfile(filename_variant):
+        yield from COMPOSITES.do(filename_variant,composite,filename_variant,overlay,url)
+    return filename_variant
+
+@asyncio.coroutine
+def daily_cache_generator(generator,serverid,backgrounds,basename,*genargs):
+    image = yield from daily_variant(generator,basename,pick_background(backgrounds,serverid),*genargs)
     return image
@@ -0,0 +1,35 @@
+import asyncio
+import concurrent.futures
+import threading
+
+class SingleFlight:
+    """Runs a coroutine once per key for all concurrent callers, callers can be on different threads and event loops"""
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+    @asyncio.coroutine
+    def do(self,key,function,*args):
+        """Result of function(*args), joining the call already in flight for key if there is one"""
+        with self._lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self.calls[key] = future
+        if leader:
+            try:
+                result = yield from function(*args)
+            except Exception as e:
+                self.forget(key)
+                future.set_exception(e)
+                raise
+            self.forget(key)
+            future.set_result(result)
+            return result
+        result = yield from asyncio.wrap_future(future)
+        return result
+    def forget(self,key):
+        with self._lock:
+            self.calls.pop(key,None)
+    def __len__(self):
+        return len(self.calls)